@@ -0,0 +1,384 @@
+import base64
+import io
+import os
+import shutil
+import tempfile
+import tracemalloc
+from concurrent.futures import Future
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.client import BOUNDARY, MULTIPART_CONTENT, encode_multipart
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+
+from api.views import UserViewSet
+from foodgram.renderers import FastJSONRenderer
+from recipe.cache import bump_generation, token_generation
+from recipe.images import log_failure
+from recipe.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                           ShoppingCart)
+from recipe.representations import recipe_representations
+from recipe.serializers import RecipeSerializer
+from user.authentication import CachedTokenAuthentication, token_cache
+from user.models import Subscription, User
+
+RECIPES = 60
+
+
+def noise_png(size):
+    buffer = io.BytesIO()
+    Image.frombytes('RGB', (size, size), os.urandom(size * size * 3)).save(
+        buffer, 'PNG')
+    buffer.name = 'noise.png'
+    return buffer
+
+
+def image_data():
+    buffer = io.BytesIO()
+    Image.new('RGB', (40, 30), 'green').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def create_user(username):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com',
+        first_name='Имя', last_name='Фамилия', password='Pa55word!')
+
+
+class RecipeQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.user = create_user('user')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(3))
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=cls.author, name=f'Рецепт {index}', text='Текст',
+                   cooking_time=index + 1, image='recipes/test.png')
+            for index in range(RECIPES))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=10)
+            for recipe in recipes for ingredient in ingredients)
+        Favorite.objects.bulk_create(
+            Favorite(user=cls.user, recipe=recipe) for recipe in recipes[::2])
+        ShoppingCart.objects.bulk_create(
+            ShoppingCart(user=cls.user, recipe=recipe)
+            for recipe in recipes[::3])
+        Subscription.objects.create(user=cls.user, author=cls.author)
+        cls.recipe = recipes[0]
+
+    def setUp(self):
+        cache.clear()
+        self.anonymous = APIClient()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertListQueries(self, client, limit, queries):
+        with self.assertNumQueries(queries):
+            response = client.get(f'/api/recipes/?limit={limit}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return response
+
+    def assertDetailQueries(self, client, queries):
+        with self.assertNumQueries(queries):
+            response = client.get(f'/api/recipes/{self.recipe.id}/')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_anonymous_list(self):
+        self.assertListQueries(self.anonymous, 6, 5)
+        cache.clear()
+        self.assertListQueries(self.anonymous, 50, 5)
+        self.assertListQueries(self.anonymous, 50, 0)
+
+    def test_authenticated_list(self):
+        self.assertListQueries(self.client, 6, 6)
+        cache.clear()
+        response = self.assertListQueries(self.client, 50, 6)
+        recipe = response.data['results'][-1]
+        self.assertTrue(recipe['author']['is_subscribed'])
+        self.assertEqual(recipe['is_favorited'], Favorite.objects.filter(
+            user=self.user, recipe_id=recipe['id']).exists())
+
+    def test_anonymous_detail(self):
+        self.assertDetailQueries(self.anonymous, 2)
+
+    def test_authenticated_detail(self):
+        response = self.assertDetailQueries(self.client, 3)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertTrue(response.data['is_in_shopping_cart'])
+        self.assertTrue(response.data['author']['is_subscribed'])
+
+
+class RecipeUpdateQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = create_user('author')
+        cls.buyer = create_user('buyer')
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(200))
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def create_recipe(self, size):
+        recipe = Recipe.objects.create(
+            author=self.author, name='Рецепт', text='Текст',
+            cooking_time=10, image='recipes/test.png')
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in self.ingredients[:size])
+        ShoppingCart.objects.create(user=self.buyer, recipe=recipe)
+        return recipe
+
+    def assertUpdateQueries(self, size, queries):
+        recipe = self.create_recipe(size)
+        half = size // 2
+        # Половина ингредиентов удаляется, половина меняет количество,
+        # и столько же добавляется новых.
+        ingredients = (self.ingredients[half:size]
+                       + self.ingredients[100:100 + half])
+        with self.assertNumQueries(queries):
+            response = self.client.patch(
+                f'/api/recipes/{recipe.id}/', {
+                    'name': 'Новое название', 'text': 'Текст',
+                    'cooking_time': 5, 'image': image_data(),
+                    'ingredients': [
+                        {'id': ingredient.id, 'amount': 2}
+                        for ingredient in ingredients],
+                }, format='json')
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertEqual(
+            dict(recipe.recipe_ingredients.values_list(
+                'ingredient_id', 'amount')),
+            {ingredient.id: 2 for ingredient in ingredients})
+        self.assertEqual(
+            dict(self.buyer.shopping_list.values_list(
+                'ingredient_id', 'total_amount')),
+            {ingredient.id: 2 for ingredient in ingredients})
+
+    def test_small_recipe(self):
+        self.assertUpdateQueries(10, 20)
+
+    def test_large_recipe(self):
+        self.assertUpdateQueries(100, 20)
+
+
+class ImageUploadMemoryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root))
+
+    def upload_avatar(self, body, content_type):
+        request = APIRequestFactory().put(
+            '/api/users/me/avatar/', body, content_type=content_type)
+        force_authenticate(request, self.user)
+        view = UserViewSet.as_view({'put': 'avatar'})
+        # Первый вызов подгружает модули Pillow, их не считаем.
+        Image.init()
+        tracemalloc.start()
+        try:
+            response = view(request)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        return response, peak
+
+    def test_multipart_upload_is_streamed(self):
+        image = noise_png(1000)
+        size = len(image.getvalue())
+        image.seek(0)
+        response, peak = self.upload_avatar(
+            encode_multipart(BOUNDARY, {'avatar': image}),
+            MULTIPART_CONTENT)
+        self.assertEqual(response.status_code, 200, response.data)
+        self.assertLess(peak, size // 4)
+
+    def test_base64_upload_memory(self):
+        image = noise_png(1000).getvalue()
+        body = ('{"avatar": "data:image/png;base64,%s"}' % base64.b64encode(
+            image).decode()).encode()
+        response, peak = self.upload_avatar(body, 'application/json')
+        self.assertEqual(response.status_code, 200, response.data)
+        # Тело, строка после разбора JSON и декодированный файл.
+        self.assertLess(peak, len(body) * 4)
+
+    @override_settings(MAX_JSON_BODY_SIZE=2 ** 10)
+    def test_json_body_limit(self):
+        body = ('{"avatar": "%s"}' % ('A' * 2 ** 20)).encode()
+        response, peak = self.upload_avatar(body, 'application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data,
+                         {'errors': 'Слишком большой запрос'})
+        self.assertLess(peak, 2 ** 16)
+
+
+class RecipeRepresentationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        authors = [create_user(f'author{index}') for index in range(5)]
+        for index, author in enumerate(authors[:3]):
+            author.avatar = f'avatars/{index}.png'
+            author.save()
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(20))
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=authors[index % len(authors)],
+                   name=f'Рецепт {index}', text='Текст',
+                   cooking_time=index + 1,
+                   image=f'recipes/{index % 7}.png')
+            for index in range(500))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient,
+                             amount=index + 1)
+            for index, recipe in enumerate(recipes)
+            for ingredient in ingredients[index % 5:index % 5 + 3])
+        Recipe.objects.filter(
+            image__in=('recipes/0.png', 'recipes/3.png')
+        ).update(image_variants=True)
+        User.objects.filter(avatar='avatars/1.png').update(
+            avatar_variants=True)
+
+    def setUp(self):
+        self.request = Request(APIRequestFactory().get('/api/recipes/'))
+
+    def assertSameOutput(self, size):
+        recipes = Recipe.objects.order_by('-id')[:size]
+        expected = RecipeSerializer(
+            recipes, many=True, context={'request': self.request}).data
+        representations = recipe_representations(
+            [recipe.id for recipe in recipes], self.request)
+        fast = [representations[recipe.id] for recipe in recipes]
+        self.assertEqual(len(fast), size)
+        self.assertEqual(JSONRenderer().render(fast),
+                         JSONRenderer().render(expected))
+
+    def test_page_of_6(self):
+        self.assertSameOutput(6)
+
+    def test_page_of_50(self):
+        self.assertSameOutput(50)
+
+    def test_page_of_500(self):
+        self.assertSameOutput(500)
+
+    def test_variants_used_only_when_ready(self):
+        ids = [Recipe.objects.filter(image=name).values_list(
+            'id', flat=True).first()
+            for name in ('recipes/0.png', 'recipes/1.png')]
+        representations = recipe_representations(ids, self.request)
+        images = {representation['image'].rsplit('/', 1)[1]
+                  for representation in representations.values()}
+        self.assertEqual(images, {'0.card.webp', '1.png'})
+
+    def test_variant_failure_is_logged(self):
+        future = Future()
+        future.set_exception(OSError('нет файла'))
+        with self.assertLogs('recipe.images', 'ERROR') as logs:
+            log_failure('recipes/missing.png', future)
+        self.assertIn('recipes/missing.png', logs.output[0])
+
+    def test_fast_renderer_matches_json_renderer(self):
+        data = {1: 'один', 'recipes': [{2: 'два'}], 'count': 3}
+        self.assertEqual(FastJSONRenderer().render(data),
+                         JSONRenderer().render(data))
+
+
+class IngredientCatalogueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.create(name='соль', measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_etag_depends_on_content_only(self):
+        etag = self.client.get('/api/ingredients/')['ETag']
+        # Другой воркер со своим кэшем в памяти получит другое поколение.
+        cache.clear()
+        with override_settings(INGREDIENT_CATALOGUE_TTL=0):
+            self.assertEqual(self.client.get('/api/ingredients/')['ETag'],
+                             etag)
+
+    def test_catalogue_expires_without_invalidation(self):
+        self.client.get('/api/ingredients/')
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='сахар', measurement_unit='г')])
+        self.assertEqual(len(self.client.get('/api/ingredients/').data), 1)
+        with override_settings(INGREDIENT_CATALOGUE_TTL=0):
+            self.assertEqual(
+                len(self.client.get('/api/ingredients/').data), 2)
+
+
+class TokenCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_user('user')
+        cls.token = Token.objects.create(user=cls.user)
+
+    def setUp(self):
+        cache.clear()
+        token_cache.clear()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+    def test_cached_token_skips_database(self):
+        with self.assertNumQueries(0):
+            authentication = CachedTokenAuthentication()
+            user, _ = authentication.authenticate_credentials(
+                self.token.key)
+        self.assertEqual(user, self.user)
+
+    def test_revocation_reaches_other_workers(self):
+        # Другой воркер удаляет токен из базы и сбрасывает поколение в
+        # общем кэше, а память этого процесса остаётся нетронутой.
+        Token.objects.filter(pk=self.token.pk)._raw_delete(
+            connection.alias)
+        bump_generation(token_generation(self.token.key))
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+    def test_deactivation_revokes_token(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 401)
+
+
+@skipUnless(connection.vendor == 'postgresql',
+            'Планы запросов проверяются только на PostgreSQL')
+class HotQueryPlanTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command('seed_benchmark', users=20, recipes=200,
+                         stdout=io.StringIO())
+
+    def test_hot_queries_use_indexes(self):
+        call_command('explain_hot_queries', stdout=io.StringIO())
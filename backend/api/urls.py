@@ -2,6 +2,7 @@ from rest_framework.routers import SimpleRouter
 from django.urls import include, path
 
 from .views import (UserViewSet, IngredientViewSet, RecipeViewSet)
+from recipe.views import get_link
 
 router = SimpleRouter()
 router.register('users', UserViewSet, basename='users')
@@ -9,6 +10,7 @@ router.register('recipes', RecipeViewSet, basename='recipe')
 router.register('ingredients', IngredientViewSet, basename='ingredient')
 
 urlpatterns = [
+    path('recipes/<int:pk>/get-link/', get_link, name='get_link'),
     path('', include(router.urls)),
     path('auth/', include('djoser.urls.authtoken'))
 ]
@@ -1,46 +1,91 @@
 from rest_framework.viewsets import ModelViewSet
 from djoser.views import UserViewSet as DjoserUserViewSet
-from django.urls import reverse
-from django.http import FileResponse
+from django.utils.cache import patch_cache_control
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import etag
+from django.http import Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
-from django.db.models import Sum
+from django.db.models import Exists, F, OuterRef, Prefetch, Value
 from rest_framework.exceptions import (ValidationError,
                                        NotAuthenticated)
 from rest_framework.decorators import action
 from rest_framework import permissions, status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
 
+from foodgram.renderers import CSVRenderer, PlainTextRenderer
+
+from recipe.cache import (INGREDIENTS_GENERATION, RECIPES_GENERATION,
+                          author_generation, get_cached_data,
+                          get_cached_many, get_generations,
+                          recipe_generation, set_cached_data,
+                          set_cached_many)
+from recipe.representations import recipe_representations
+from recipe.search import get_catalogue
 from recipe.subfunctions import render_shopping_cart
 from recipe.models import (Ingredient, Recipe, Favorite,
-                           ShoppingCart, RecipeIngredient)
+                           ShoppingCart, RecipeIngredient, ShoppingListItem)
 from user.models import Subscription, User
 from recipe.serializers import (IngredientSerializer, RecipeSerializer,
-                                UserSerializer, AvatarSerializer,
-                                UserSubscriptionSerializer)
+                                RecipeImageSerializer, UserSerializer,
+                                AvatarSerializer, UserSubscriptionSerializer)
+from recipe.uploadhandlers import read_image_upload
 from recipe.permissions import IsAuthorOrReadOnly
 
 
+INGREDIENTS_MAX_AGE = 60 * 60
+
+
+def ingredients_etag(request, *args, **kwargs):
+    return f'ingredients-{get_catalogue().etag}'
+
+
+@method_decorator(etag(ingredients_etag), name='list')
+@method_decorator(etag(ingredients_etag), name='retrieve')
 class IngredientViewSet(ModelViewSet):
     serializer_class = IngredientSerializer
     permission_classes = [permissions.AllowAny]
     http_method_names = ['get', 'head', 'options']
     pagination_class = None
+    queryset = Ingredient.objects.all().order_by('name')
 
-    def get_queryset(self):
-        queryset = Ingredient.objects.all().order_by('name')
-        name = self.request.query_params.get('name', '').strip()
-        if name:
-            queryset = queryset.filter(name__istartswith=name)
-        return queryset
+    def list(self, request, *args, **kwargs):
+        catalogue = get_catalogue()
+        name = request.query_params.get('name', '').strip()
+        return self.cached_response(
+            catalogue.search(name) if name else catalogue.rows)
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            ingredient = get_catalogue().by_id[int(kwargs['pk'])]
+        except (KeyError, ValueError):
+            raise Http404
+        return self.cached_response(ingredient)
+
+    @staticmethod
+    def cached_response(data):
+        response = Response(data)
+        patch_cache_control(response, public=True,
+                            max_age=INGREDIENTS_MAX_AGE)
+        return response
 
 
 class RecipeViewSet(ModelViewSet):
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = [IsAuthorOrReadOnly]
+    cursor_ordering = ('-date_published', '-id')
 
     def get_queryset(self):
-        queryset = Recipe.objects.all().order_by('-date_published')
+        queryset = Recipe.objects.select_related('author')
+        # При правке ингредиенты перечитываются под блокировкой рецепта.
+        if self.request.method in permissions.SAFE_METHODS:
+            queryset = queryset.prefetch_related(
+                Prefetch('recipe_ingredients',
+                         queryset=RecipeIngredient.objects.select_related(
+                             'ingredient')))
+        queryset = self.annotate_user_flags(
+            queryset.order_by(*self.cursor_ordering))
         params = self.request.query_params
 
         author_id = params.get('author')
@@ -48,29 +93,126 @@ class RecipeViewSet(ModelViewSet):
             queryset = queryset.filter(author_id=author_id)
 
         if self.request.user.is_authenticated:
-            is_in_shopping_cart = params.get('is_in_shopping_cart')
-            if is_in_shopping_cart is not None:
-                if is_in_shopping_cart == '1':
-                    queryset = queryset.filter(
-                        shoppingcart__user=self.request.user
-                    )
-                elif is_in_shopping_cart == '0':
-                    queryset = queryset.exclude(
-                        shoppingcart__user=self.request.user
-                    )
-
-            is_favorited = params.get('is_favorited')
-            if is_favorited is not None:
-                if is_favorited == '1':
-                    queryset = queryset.filter(
-                        favorite__user=self.request.user
-                    )
-                elif is_favorited == '0':
-                    queryset = queryset.exclude(
-                        favorite__user=self.request.user
-                    )
-
-        return queryset.distinct()
+            for flag in ('is_in_shopping_cart', 'is_favorited'):
+                value = params.get(flag)
+                if value in ('0', '1'):
+                    queryset = queryset.filter(**{flag: value == '1'})
+
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return self.anonymous_cached(self.fragment_list, request,
+                                         *args, **kwargs)
+        return self.fragment_list(request, *args, **kwargs)
+
+    def get_page_queryset(self):
+        return (self.filter_queryset(self.get_queryset())
+                .select_related(None)
+                .prefetch_related(None)
+                .only('id', 'author_id', 'date_published'))
+
+    def fragment_list(self, request, *args, **kwargs):
+        page = self.paginate_queryset(self.get_page_queryset())
+        subscribed_ids = self.get_subscribed_author_ids(page)
+        fragments = self.get_recipe_fragments(page)
+        return self.get_paginated_response([
+            self.overlay_user_flags(fragments[recipe.id], recipe,
+                                    subscribed_ids)
+            for recipe in page
+        ])
+
+    def get_subscribed_author_ids(self, recipes):
+        user = self.request.user
+        if not user.is_authenticated or not recipes:
+            return set()
+        return set(user.subscribers.filter(
+            author_id__in={recipe.author_id for recipe in recipes}
+        ).values_list('author_id', flat=True))
+
+    def get_recipe_fragments(self, recipes):
+        keys = {
+            recipe.id: f'recipe-fragment:{self.request.get_host()}:{recipe.id}'
+            for recipe in recipes
+        }
+        fragments = get_cached_many(keys.values())
+        missing = {recipe.id: recipe.author_id for recipe in recipes
+                   if keys[recipe.id] not in fragments}
+        if missing:
+            generations = get_generations({
+                INGREDIENTS_GENERATION,
+                *map(recipe_generation, missing),
+                *map(author_generation, missing.values()),
+            })
+            fresh = {
+                keys[pk]: (
+                    data,
+                    (recipe_generation(pk),
+                     author_generation(data['author']['id']),
+                     INGREDIENTS_GENERATION)
+                )
+                for pk, data in recipe_representations(
+                    list(missing), self.request).items()
+            }
+            set_cached_many(fresh, generations)
+            fragments.update(
+                (key, data) for key, (data, _) in fresh.items())
+        return {pk: fragments[key] for pk, key in keys.items()}
+
+    @staticmethod
+    def overlay_user_flags(fragment, recipe, subscribed_ids):
+        return {
+            **fragment,
+            'author': {
+                **fragment['author'],
+                'is_subscribed': recipe.author_id in subscribed_ids,
+            },
+            'is_favorited': recipe.is_favorited,
+            'is_in_shopping_cart': recipe.is_in_shopping_cart,
+        }
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.anonymous_cached(super().retrieve, request,
+                                     *args, **kwargs)
+
+    def anonymous_cached(self, view, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+
+        key = f'anonymous:{request.get_host()}:{request.get_full_path()}'
+        data = get_cached_data(key)
+        if data is not None:
+            return Response(data)
+
+        # Авторы заранее неизвестны, их поколения читаются при записи.
+        generations = get_generations({
+            RECIPES_GENERATION if 'pk' not in kwargs
+            else recipe_generation(kwargs['pk']),
+            INGREDIENTS_GENERATION,
+        })
+        response = view(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            recipes = response.data.get('results', [response.data])
+            set_cached_data(key, response.data, {
+                RECIPES_GENERATION if 'results' in response.data
+                else recipe_generation(response.data['id']),
+                INGREDIENTS_GENERATION,
+                *(author_generation(recipe['author']['id'])
+                  for recipe in recipes),
+            }, generations)
+        return response
+
+    def annotate_user_flags(self, queryset):
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(is_favorited=Value(False),
+                                     is_in_shopping_cart=Value(False))
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
 
     def perform_create(self, serializer):
         if not self.request.user.is_authenticated:
@@ -112,39 +254,46 @@ class RecipeViewSet(ModelViewSet):
     def favorite(self, request, pk=None):
         return self.handle_fav_or_cart(request, Favorite, pk)
 
-    @action(detail=False, methods=['get'])
+    @action(detail=False, methods=['get'],
+            permission_classes=[permissions.IsAuthenticated],
+            renderer_classes=[JSONRenderer, PlainTextRenderer, CSVRenderer])
     def download_shopping_cart(self, request):
         user = request.user
+        renderer = request.accepted_renderer
+        if renderer.format == 'json':
+            renderer = PlainTextRenderer()
 
         ingredients = (
-            RecipeIngredient.objects
-            .filter(recipe__shoppingcart__user=user)
+            ShoppingListItem.objects
+            .filter(user=user)
             .values('ingredient__name',
-                    'ingredient__measurement_unit')
-            .annotate(total_amount=Sum('amount'))
+                    'ingredient__measurement_unit',
+                    'total_amount')
             .order_by('ingredient__name')
         )
 
         recipes = Recipe.objects.filter(
-            shoppingcart__user=user)
-
-        shopping_cart_text = render_shopping_cart(user, ingredients, recipes)
+            shoppingcart__user=user
+        ).select_related('author').values_list('name', 'author__username')
 
-        return FileResponse(
-            shopping_cart_text,
-            as_attachment=True,
-            filename='shopping_list.txt',
-            content_type='text/plain'
+        response = StreamingHttpResponse(
+            render_shopping_cart(ingredients.iterator(), recipes.iterator(),
+                                 renderer.format),
+            content_type=f'{renderer.media_type}; charset=utf-8'
         )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_list.{renderer.format}"')
+        return response
 
-    @action(detail=True, methods=['get'], url_path='get-link')
-    def get_link(self, request, pk=None):
+    @action(detail=True, methods=['put'])
+    def image(self, request, pk=None):
         recipe = self.get_object()
-        short_url = request.build_absolute_uri(
-            reverse('short_link', args=[recipe.pk])
-        ).split(':8000')
-        short_url = short_url[0]+short_url[1]
-        return Response({'short-link': short_url}, status=status.HTTP_200_OK)
+        serializer = RecipeImageSerializer(
+            recipe, data=read_image_upload(request),
+            context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        serializer.save()
+        return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class UserViewSet(DjoserUserViewSet):
@@ -153,6 +302,12 @@ class UserViewSet(DjoserUserViewSet):
     permission_classes = [permissions.AllowAny]
     lookup_field = 'id'
 
+    @property
+    def cursor_ordering(self):
+        if self.action == 'subscriptions':
+            return ('subscription_id',)
+        return None
+
     def get_permissions(self):
         if self.action == 'create':
             self.permission_classes = [permissions.AllowAny]
@@ -172,15 +327,15 @@ class UserViewSet(DjoserUserViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
             else:
-                user.avatar.delete()
                 user.avatar = None
                 user.save()
                 return Response(status=status.HTTP_204_NO_CONTENT)
 
-        if 'avatar' not in request.data:
+        data = read_image_upload(request)
+        if 'avatar' not in data:
             return Response(status=status.HTTP_400_BAD_REQUEST)
 
-        serializer = AvatarSerializer(user, data=request.data, partial=True)
+        serializer = AvatarSerializer(user, data=data, partial=True)
 
         if not serializer.is_valid():
             raise ValidationError(serializer.errors)
@@ -191,13 +346,23 @@ class UserViewSet(DjoserUserViewSet):
     @action(detail=False, methods=['get'], permission_classes=[
         permissions.IsAuthenticated])
     def subscriptions(self, request):
-        subscriptions = request.user.subscribers.select_related(
-            'author').prefetch_related('author__recipes')
+        recipes = Recipe.objects.all()
+        try:
+            recipes = recipes[:int(request.query_params['recipes_limit'])]
+        except (KeyError, ValueError):
+            pass
+
+        authors = User.objects.filter(authors__user=request.user).annotate(
+            subscription_id=F('authors__id'),
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        ).order_by('subscription_id')
 
-        authors = [subscription.author for subscription in subscriptions]
         page = self.paginate_queryset(authors)
         serializer = UserSubscriptionSerializer(page, many=True, context={
-            'request': request})
+            'request': request,
+            'subscribed_author_ids': {author.id for author in page},
+        })
         return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post', 'delete'],
@@ -228,7 +393,8 @@ class UserViewSet(DjoserUserViewSet):
         
         if request.method == 'DELETE':
             try:
-                subscription = Subscription.objects.get(user=user, author=author)
+                subscription = Subscription.objects.get(user=user,
+                                                        author=author)
                 subscription.delete()
                 return Response(
                     {'status': 'Вы успешно отписались'},
@@ -0,0 +1,103 @@
+import threading
+from collections import defaultdict, deque
+from statistics import quantiles
+
+from django.conf import settings
+from django.http import HttpResponse
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class EndpointStats:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.queries = 0
+        self.db_duration = 0.0
+        self.render_duration = 0.0
+        self.response_bytes = 0
+        self.window = deque(maxlen=settings.METRICS_WINDOW)
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._stats = defaultdict(EndpointStats)
+        self._lock = threading.Lock()
+
+    def record(self, view, duration, queries, db_duration, render_duration,
+               response_bytes):
+        with self._lock:
+            stats = self._stats[view]
+            stats.count += 1
+            stats.duration += duration
+            stats.queries += queries
+            stats.db_duration += db_duration
+            stats.render_duration += render_duration
+            stats.response_bytes += response_bytes
+            stats.window.append(duration)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                view: (stats.count, stats.duration, stats.queries,
+                       stats.db_duration, stats.render_duration,
+                       stats.response_bytes, list(stats.window))
+                for view, stats in self._stats.items()
+            }
+
+    def clear(self):
+        with self._lock:
+            self._stats.clear()
+
+
+registry = MetricsRegistry()
+
+
+def window_quantiles(window):
+    if len(window) < 2:
+        return {quantile: window[0] if window else 0.0
+                for quantile in QUANTILES}
+    cuts = quantiles(window, n=100, method='inclusive')
+    return {quantile: cuts[round(quantile * 100) - 1]
+            for quantile in QUANTILES}
+
+
+def label(view):
+    return view.replace('\\', '\\\\').replace('"', '\\"')
+
+
+def render_metrics():
+    counters = {
+        'foodgram_requests_total': ('counter', 'Обработано запросов', 0),
+        'foodgram_db_queries_total': ('counter', 'SQL-запросов', 2),
+        'foodgram_db_duration_seconds_total': (
+            'counter', 'Время в базе данных', 3),
+        'foodgram_render_duration_seconds_total': (
+            'counter', 'Время рендеринга ответа', 4),
+        'foodgram_response_bytes_total': ('counter', 'Байт в ответах', 5),
+    }
+    snapshot = sorted(registry.snapshot().items())
+    lines = []
+    for metric, (kind, help_text, index) in counters.items():
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for view, values in snapshot:
+            lines.append(f'{metric}{{view="{label(view)}"}} {values[index]}')
+
+    metric = 'foodgram_request_duration_seconds'
+    lines.append(f'# HELP {metric} Время обработки запроса')
+    lines.append(f'# TYPE {metric} summary')
+    for view, values in snapshot:
+        count, duration, window = values[0], values[1], values[6]
+        for quantile, value in window_quantiles(window).items():
+            lines.append(f'{metric}{{view="{label(view)}",'
+                         f'quantile="{quantile}"}} {value}')
+        lines.append(f'{metric}_sum{{view="{label(view)}"}} {duration}')
+        lines.append(f'{metric}_count{{view="{label(view)}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    return HttpResponse(
+        render_metrics(),
+        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,93 @@
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_duration = 0.0
+        self.render_duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_duration += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.metrics = metrics = RequestMetrics()
+        started = time.perf_counter()
+        with self.track_queries(metrics):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        response['Server-Timing'] = (
+            f'db;dur={metrics.db_duration * 1000:.1f};'
+            f'desc="{metrics.queries} SQL", '
+            f'render;dur={metrics.render_duration * 1000:.1f}, '
+            f'total;dur={duration * 1000:.1f}'
+        )
+        if response.streaming:
+            response.streaming_content = self.stream(
+                request, view, metrics, started, response.streaming_content)
+        else:
+            self.record(request, view, metrics, started, len(response.content))
+        return response
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def rendered(response):
+            request.metrics.render_duration += (
+                time.perf_counter() - started)
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def track_queries(metrics):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        return stack
+
+    def stream(self, request, view, metrics, started, content):
+        response_bytes = 0
+        try:
+            with self.track_queries(metrics):
+                for chunk in content:
+                    response_bytes += len(chunk)
+                    yield chunk
+        finally:
+            self.record(request, view, metrics, started, response_bytes)
+
+    @staticmethod
+    def record(request, view, metrics, started, response_bytes):
+        duration = time.perf_counter() - started
+        registry.record(view, duration, metrics.queries,
+                        metrics.db_duration, metrics.render_duration,
+                        response_bytes)
+        if metrics.queries > settings.METRICS_QUERY_WARNING:
+            logger.warning('%s %s: %d SQL-запросов за %.1f мс',
+                           request.method, view, metrics.queries,
+                           duration * 1000)
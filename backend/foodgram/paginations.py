@@ -1,6 +1,115 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.ordering = getattr(view, 'cursor_ordering', None)
+        if self.ordering and self.cursor_query_param in request.query_params:
+            return self.paginate_keyset(queryset, request)
+        self.ordering = None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.ordering:
+            return Response(OrderedDict([
+                ('next', self.get_next_cursor_link()),
+                ('results', data),
+            ]))
+        return super().get_paginated_response(data)
+
+    def paginate_keyset(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset)
+
+        queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+
+        results = list(queryset[:page_size + 1])
+        page = results[:page_size]
+        self.next_position = (
+            self.get_position(page[-1]) if len(results) > page_size
+            else None
+        )
+        return page
+
+    def get_position_filter(self, position):
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            equal = {
+                previous.lstrip('-'): value for previous, value
+                in zip(self.ordering[:index], position)
+            }
+            condition |= Q(**equal, **{f'{name}__{lookup}': position[index]})
+        return condition
+
+    def get_position(self, instance):
+        position = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            position.append(value)
+        return position
+
+    def get_ordering_field(self, queryset, name):
+        annotation = queryset.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        try:
+            return queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            raise NotFound(self.invalid_cursor_message)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded))
+        except (TypeError, ValueError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        if (not isinstance(position, list)
+                or len(position) != len(self.ordering)):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            position = [
+                self.get_ordering_field(
+                    queryset, field.lstrip('-')).to_python(value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if None in position:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(
+            json.dumps(position).encode()).decode()
+
+    def get_next_cursor_link(self):
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.next_position))
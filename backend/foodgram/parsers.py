@@ -0,0 +1,19 @@
+import io
+
+from django.conf import settings
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+
+
+class LimitedJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        limit = settings.MAX_JSON_BODY_SIZE
+        request = (parser_context or {}).get('request')
+        content_length = int(
+            request.META.get('CONTENT_LENGTH') or 0) if request else 0
+        if content_length > limit:
+            raise ValidationError({'errors': 'Слишком большой запрос'})
+        body = stream.read(limit + 1)
+        if len(body) > limit:
+            raise ValidationError({'errors': 'Слишком большой запрос'})
+        return super().parse(io.BytesIO(body), media_type, parser_context)
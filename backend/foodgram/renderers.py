@@ -0,0 +1,39 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None
+                or self.get_indent(accepted_media_type or '',
+                                   renderer_context or {})):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        return orjson.dumps(data, default=self.encoder.default,
+                            option=orjson.OPT_NON_STR_KEYS)
+
+
+class FileRenderer(BaseRenderer):
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, (str, bytes)):
+            return data
+        return JSONRenderer().render(data)
+
+
+class PlainTextRenderer(FileRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(FileRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
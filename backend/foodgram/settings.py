@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -89,9 +90,62 @@ DATABASES = {
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', 'foodgram_password'),
         'HOST': os.getenv('DB_HOST', 'db'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv(
+            'DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
     }
 }
 
+if os.getenv('SERVER_MODE', 'wsgi') == 'asgi':
+    # Асинхронные представления выполняются в разных потоках, поэтому
+    # постоянные соединения там не переиспользуются; используйте DB_POOL.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+
+if os.getenv('DB_POOL', 'false').lower() == 'true':
+    from psycopg_pool import ConnectionPool
+
+    # Пул сам держит соединения, постоянные соединения Django с ним
+    # несовместимы.
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', 2)),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', 10)),
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+            'max_idle': float(os.getenv('DB_POOL_MAX_IDLE', 600)),
+            'check': ConnectionPool.check_connection,
+        },
+    }
+
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django.core.cache.backends.redis.RedisCache',
+}
+
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+        'LOCATION': os.getenv('CACHE_LOCATION',
+                              os.path.join(BASE_DIR, 'cache')),
+    }
+}
+
+# По умолчанию locmem и file хранят 300 записей, а на каждый рецепт
+# приходятся фрагмент, ответ и поколения рецепта и автора, поэтому кэш
+# вытеснял сам себя. Redis ограничивается своим maxmemory.
+if CACHE_BACKEND != 'redis':
+    CACHES['default']['OPTIONS'] = {
+        'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', 100000)),
+    }
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+# С кэшем в памяти процесса другие воркеры не видят сброс поколения и
+# перечитывают справочник ингредиентов не реже этого интервала.
+INGREDIENT_CATALOGUE_TTL = int(os.getenv('INGREDIENT_CATALOGUE_TTL', 60))
+
 AUTHENTICATION_BACKENDS = [
     "django.contrib.auth.backends.ModelBackend",
 ]
@@ -126,7 +180,16 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly'],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'user.authentication.CachedTokenAuthentication',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'foodgram.parsers.LimitedJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'foodgram.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
 }
 
@@ -149,4 +212,22 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+MAX_IMAGE_UPLOAD_SIZE = int(os.getenv('MAX_IMAGE_UPLOAD_SIZE', 10 * 2 ** 20))
+FILE_UPLOAD_MAX_MEMORY_SIZE = 2 ** 20
+MAX_JSON_BODY_SIZE = MAX_IMAGE_UPLOAD_SIZE * 4 // 3 + 2 ** 20
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+
+SHORT_LINK_CACHE_SIZE = int(os.getenv('SHORT_LINK_CACHE_SIZE', 10000))
+SHORT_LINK_CACHE_TTL = int(os.getenv('SHORT_LINK_CACHE_TTL', 300))
+
+# Отзыв токена виден другим процессам сразу при общем кэше (redis, file),
+# а с кэшем в памяти процесса — по истечении TTL.
+AUTH_TOKEN_CACHE_SIZE = int(os.getenv('AUTH_TOKEN_CACHE_SIZE', 10000))
+AUTH_TOKEN_CACHE_TTL = int(os.getenv('AUTH_TOKEN_CACHE_TTL', 60))
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'false').lower() == 'true'
+METRICS_QUERY_WARNING = int(os.getenv('METRICS_QUERY_WARNING', 30))
+METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', 1000))
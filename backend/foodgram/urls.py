@@ -3,12 +3,17 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import include, path
 
+from .metrics import metrics
+
 urlpatterns = [
     path('', include('recipe.urls')),
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
 ]
 
+if settings.METRICS_ENABLED:
+    urlpatterns.append(path('metrics/', metrics, name='metrics'))
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL,
                           document_root=settings.MEDIA_ROOT)
@@ -1,10 +1,12 @@
 from django.contrib import admin
+from django.db.models import Count
 from django.utils.html import mark_safe
 from import_export.resources import ModelResource
 from import_export.admin import ImportExportModelAdmin
 from .models import (Ingredient, Recipe, RecipeIngredient,
                      Favorite, ShoppingCart)
 from .filters import CookingTimeFilter
+from .subfunctions import delete_recipe_ingredients
 
 from user.models import (User, Subscription)
 
@@ -13,11 +15,15 @@ from user.models import (User, Subscription)
 class UserAdmin(admin.ModelAdmin):
     list_display = (
         'id', 'username', 'full_name', 'email', 'avatar_preview',
-        'recipe_count', 'subscription_count', 'subscriber_count'
+        'recipes_count', 'subscription_count', 'subscribers_count'
     )
     search_fields = ('username', 'email')
     list_filter = ('is_staff', 'is_active')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(
+            subscription_count=Count('subscribers'))
+
     @admin.display(description="ФИО")
     def full_name(self, obj):
         return obj.full_name()
@@ -31,17 +37,10 @@ class UserAdmin(admin.ModelAdmin):
                 'style="border-radius:50%;">'
             )
 
-    @admin.display(description="Рецептов")
-    def recipe_count(self, obj):
-        return obj.recipes.count()
-
-    @admin.display(description="Подписок")
+    @admin.display(description="Подписок",
+                   ordering='subscription_count')
     def subscription_count(self, obj):
-        return obj.subscribers.count()
-
-    @admin.display(description="Подписчиков")
-    def subscriber_count(self, obj):
-        return obj.authors.count()
+        return obj.subscription_count
 
 
 class IngredientResource(ModelResource):
@@ -51,7 +50,7 @@ class IngredientResource(ModelResource):
         skip_first_row = True
         encoding = 'utf-8-sig'
         import_mode = 1
-        import_id_fields = []
+        import_id_fields = ['name', 'measurement_unit']
 
 
 @admin.register(Ingredient)
@@ -78,10 +77,6 @@ class RecipeAdmin(ImportExportModelAdmin):
     list_filter = ('author', CookingTimeFilter)
     inlines = [RecipeIngredientInline]
 
-    @admin.display(description='В избранном')
-    def favorites_count(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
-
     @admin.display(description='Ингредиенты')
     @mark_safe
     def ingredients_list(self, obj):
@@ -106,6 +101,9 @@ class RecipeIngredientAdmin(admin.ModelAdmin):
     list_filter = ('recipe', 'ingredient')
     search_fields = ('recipe__name', 'ingredient__name')
 
+    def delete_queryset(self, request, queryset):
+        delete_recipe_ingredients(queryset)
+
 
 @admin.register(Favorite, ShoppingCart)
 class UserRecipeRelationAdmin(admin.ModelAdmin):
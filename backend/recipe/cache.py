@@ -0,0 +1,97 @@
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+INGREDIENTS_GENERATION = 'ingredients'
+RECIPES_GENERATION = 'recipes'
+
+
+def recipe_generation(pk):
+    return f'recipe:{pk}'
+
+
+def author_generation(pk):
+    return f'author:{pk}'
+
+
+def token_generation(key):
+    return f'token:{key}'
+
+
+def generation_key(name):
+    return f'generation:{name}'
+
+
+def new_generation():
+    return uuid4().hex[:16]
+
+
+def get_generation(name):
+    return cache.get_or_set(generation_key(name), new_generation,
+                            timeout=None)
+
+
+def peek_generation(name):
+    # В отличие от get_generation не создаёт ключ: поколение появляется
+    # только при сбросе, и запросы с чужими токенами не засоряют кэш.
+    return cache.get(generation_key(name))
+
+
+def get_generations(names):
+    keys = {generation_key(name): name for name in names}
+    found = cache.get_many(keys)
+    missing = {key: new_generation() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, timeout=None)
+        found.update(missing)
+    return {name: found[key] for key, name in keys.items()}
+
+
+def bump_generation(*names):
+    cache.set_many({generation_key(name): new_generation() for name in names},
+                   timeout=None)
+
+
+def bump_generation_on_commit(*names):
+    transaction.on_commit(lambda: bump_generation(*names))
+
+
+def get_cached_many(keys):
+    entries = cache.get_many(keys)
+    current = get_generations({
+        name for entry in entries.values() for name in entry['generations']
+    })
+    return {
+        key: entry['data'] for key, entry in entries.items()
+        if all(current[name] == generation
+               for name, generation in entry['generations'].items())
+    }
+
+
+def set_cached_many(items, generations=None):
+    # generations — снимок поколений, прочитанный до построения данных:
+    # если их сбросили, пока данные строились, запись сразу устареет.
+    current = dict(generations or {})
+    missing = {
+        name for _, generation_names in items.values()
+        for name in generation_names
+    } - current.keys()
+    if missing:
+        current.update(get_generations(missing))
+    cache.set_many({
+        key: {
+            'data': data,
+            'generations': {name: current[name] for name in generation_names},
+        }
+        for key, (data, generation_names) in items.items()
+    }, timeout=settings.RESPONSE_CACHE_TIMEOUT)
+
+
+def get_cached_data(key):
+    return get_cached_many([key]).get(key)
+
+
+def set_cached_data(key, data, generation_names, generations=None):
+    set_cached_many({key: (data, generation_names)}, generations)
@@ -1,5 +1,47 @@
-import numpy as np
+from math import ceil
+
 from django.contrib import admin
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.db.models import Count, Max, Min, Q
+
+from .cache import RECIPES_GENERATION, get_cached_data, set_cached_data
+
+BUCKETS_CACHE_KEY = 'admin:cooking_time_buckets'
+
+
+def parse_range(value):
+    low, separator, high = value.partition('-')
+    try:
+        return int(low), int(high) if high else None
+    except ValueError:
+        raise IncorrectLookupParameters(
+            f'Неверный диапазон времени готовки: {value}')
+
+
+def range_filter(low, high):
+    condition = Q(cooking_time__gte=low)
+    if high is not None:
+        condition &= Q(cooking_time__lt=high)
+    return condition
+
+
+def cooking_time_buckets(queryset):
+    stats = queryset.aggregate(
+        low=Min('cooking_time'), high=Max('cooking_time'),
+        distinct=Count('cooking_time', distinct=True))
+    if stats['distinct'] < 3:
+        return ()
+
+    low, high = stats['low'], stats['high']
+    fast_time = low + ceil((high - low) / 3)
+    slow_time = low + ceil((high - low) * 2 / 3)
+    ranges = [(0, fast_time), (fast_time, slow_time), (slow_time, None)]
+    counts = queryset.aggregate(**{
+        f'bucket_{index}': Count('id', filter=range_filter(*bounds))
+        for index, bounds in enumerate(ranges)
+    })
+    return fast_time, slow_time, [
+        counts[f'bucket_{index}'] for index in range(len(ranges))]
 
 
 class CookingTimeFilter(admin.SimpleListFilter):
@@ -7,26 +49,26 @@ class CookingTimeFilter(admin.SimpleListFilter):
     parameter_name = "cooking_time_range"
 
     def lookups(self, request, model_admin):
-        qs = model_admin.model.objects.values_list("cooking_time", flat=True)
-        times = [time for time in set(qs)]
+        buckets = get_cached_data(BUCKETS_CACHE_KEY)
+        if buckets is None:
+            buckets = cooking_time_buckets(model_admin.model.objects.all())
+            set_cached_data(BUCKETS_CACHE_KEY, buckets, {RECIPES_GENERATION})
 
-        if len(times) < 3:
+        if not buckets:
             return []
 
-        counts, bins = np.histogram(times, bins=3)
-
-        fast_time, slow_time = int(bins[1]), int(bins[2])
+        fast_time, slow_time, counts = buckets
 
         return [
-            ((0, fast_time), f'быстрее {fast_time} мин ({counts[0]})'),
-            ((fast_time, slow_time), f'{fast_time}–{slow_time} мин ({counts[1]})'),
-            ((slow_time, 10**10), f'дольше {slow_time} мин ({counts[0]})'),
+            (f'0-{fast_time}', f'быстрее {fast_time} мин ({counts[0]})'),
+            (f'{fast_time}-{slow_time}',
+             f'{fast_time}–{slow_time} мин ({counts[1]})'),
+            (f'{slow_time}-', f'дольше {slow_time} мин ({counts[2]})'),
         ]
 
     def queryset(self, request, queryset):
         value = self.value()
         if value:
-            range_tuple = eval(value)
-            return queryset.filter(cooking_time__range=range_tuple)
+            return queryset.filter(range_filter(*parse_range(value)))
 
         return queryset
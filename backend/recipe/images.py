@@ -0,0 +1,170 @@
+import hashlib
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
+from django.db import close_old_connections, transaction
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+from .cache import (RECIPES_GENERATION, author_generation, bump_generation,
+                    recipe_generation)
+from .models import Recipe
+from user.models import User
+
+IMAGE_VARIANTS = {
+    'card': (640, 640),
+    'thumbnail': (320, 320),
+    'avatar': (128, 128),
+}
+RECIPE_VARIANTS = ('card', 'thumbnail')
+AVATAR_VARIANTS = ('avatar',)
+VARIANT_QUALITY = 80
+
+logger = logging.getLogger(__name__)
+
+executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'IMAGE_WORKERS', 2),
+    thread_name_prefix='image-variants'
+)
+
+
+def variant_name(name, variant):
+    return f'{posixpath.splitext(name)[0]}.{variant}.webp'
+
+
+def render_variant(original, variant):
+    image = ImageOps.exif_transpose(Image.open(original))
+    image.thumbnail(IMAGE_VARIANTS[variant])
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    image.save(buffer, 'WEBP', quality=VARIANT_QUALITY)
+    return buffer.getvalue()
+
+
+def make_variant(name, variant):
+    target = variant_name(name, variant)
+    if default_storage.exists(target):
+        return
+    with default_storage.open(name) as original:
+        data = render_variant(original, variant)
+    default_storage.save(target, ContentFile(data))
+
+
+def variants_exist(name, variants):
+    return bool(name) and all(
+        default_storage.exists(variant_name(name, variant))
+        for variant in variants)
+
+
+def mark_variants(model, field, name):
+    # Одно изображение может быть у нескольких строк: файлы называются по
+    # хэшу содержимого.
+    flag = f'{field}_variants'
+    pks = list(model.objects.filter(**{field: name, flag: False})
+               .values_list('pk', flat=True))
+    model.objects.filter(pk__in=pks).update(**{flag: True})
+    return pks
+
+
+def recipe_variants_ready(name):
+    pks = mark_variants(Recipe, 'image', name)
+    if pks:
+        bump_generation(RECIPES_GENERATION, *map(recipe_generation, pks))
+
+
+def avatar_variants_ready(name):
+    pks = mark_variants(User, 'avatar', name)
+    if pks:
+        bump_generation(*map(author_generation, pks))
+
+
+def make_variants(name, variants, ready):
+    for variant in variants:
+        make_variant(name, variant)
+    close_old_connections()
+    try:
+        ready(name)
+    finally:
+        close_old_connections()
+
+
+def log_failure(name, future):
+    try:
+        future.result()
+    except Exception:
+        logger.exception('Не удалось подготовить копии изображения %s', name)
+
+
+def schedule_variants(name, variants, ready):
+    if not name:
+        return
+    transaction.on_commit(lambda: executor.submit(
+        make_variants, name, variants, ready
+    ).add_done_callback(partial(log_failure, name)))
+
+
+def image_url(name, request=None, variant=None):
+    # variant передаётся, только если копии уже готовы: флаг *_variants
+    # ставится при сохранении, а не проверкой хранилища на каждый ответ.
+    if not name:
+        return None
+    if variant:
+        name = variant_name(name, variant)
+    url = default_storage.url(name)
+    return request.build_absolute_uri(url) if request else url
+
+
+def rendered_in_list(field):
+    parent = field.parent
+    while parent is not None:
+        if isinstance(parent, serializers.ListSerializer):
+            return True
+        parent = parent.parent
+    return False
+
+
+class ImageField(Base64ImageField):
+    def __init__(self, *args, upload_to='', variant=None, **kwargs):
+        self.upload_to = upload_to
+        self.variant = variant
+        super().__init__(*args, **kwargs)
+
+    def get_file_name(self, decoded_file):
+        return hashlib.sha256(decoded_file).hexdigest()
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            image = serializers.ImageField.to_internal_value(self, data)
+            image.name = self.get_upload_name(image)
+        else:
+            image = super().to_internal_value(data)
+        if image is None:
+            return image
+        name = posixpath.join(self.upload_to, image.name)
+        if default_storage.exists(name):
+            return name
+        return image
+
+    def get_upload_name(self, image):
+        digest = hashlib.sha256()
+        for chunk in image.chunks():
+            digest.update(chunk)
+        image.seek(0)
+        return f'{digest.hexdigest()}.{image.image.format.lower()}'
+
+    def to_representation(self, file):
+        if not file or self.represent_in_base64:
+            return super().to_representation(file)
+        ready = getattr(file.instance, f'{file.field.name}_variants', False)
+        return image_url(
+            file.name, self.context.get('request'),
+            self.variant if ready and rendered_in_list(self) else None)
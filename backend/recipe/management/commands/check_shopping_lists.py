@@ -0,0 +1,67 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Sum
+
+from recipe.models import RecipeIngredient, ShoppingListItem
+
+
+def recompute_totals():
+    return {
+        (row['recipe__shoppingcart__user'], row['ingredient']):
+            row['total_amount']
+        for row in RecipeIngredient.objects
+        .filter(recipe__shoppingcart__isnull=False)
+        .values('recipe__shoppingcart__user', 'ingredient')
+        .annotate(total_amount=Sum('amount'))
+        .order_by()
+        .iterator()
+    }
+
+
+class Command(BaseCommand):
+    help = ('Сверяет сохранённые списки покупок с полным пересчётом '
+            'по корзинам. С флагом --rebuild пересобирает их.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rebuild', action='store_true',
+            help='Пересобрать списки покупок из корзин'
+        )
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            return self.rebuild()
+
+        expected = recompute_totals()
+        stored = {
+            (user_id, ingredient_id): total_amount
+            for user_id, ingredient_id, total_amount
+            in ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount').iterator()
+        }
+        mismatches = 0
+        for key in expected.keys() | stored.keys():
+            if expected.get(key) != stored.get(key):
+                mismatches += 1
+                user_id, ingredient_id = key
+                self.stdout.write(
+                    f'Пользователь {user_id}, ингредиент {ingredient_id}: '
+                    f'{stored.get(key)} вместо {expected.get(key)}')
+        if mismatches:
+            raise CommandError(
+                f'Найдено расхождений: {mismatches}. '
+                'Запустите check_shopping_lists --rebuild')
+        self.stdout.write(self.style.SUCCESS('Списки покупок согласованы'))
+
+    @transaction.atomic
+    def rebuild(self):
+        ShoppingListItem.objects.all().delete()
+        items = ShoppingListItem.objects.bulk_create(
+            (ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                              total_amount=total_amount)
+             for (user_id, ingredient_id), total_amount
+             in recompute_totals().items()),
+            batch_size=1000
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны: {len(items)} позиций'))
@@ -0,0 +1,196 @@
+import json
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from rest_framework.test import (APIClient, APIRequestFactory,
+                                 force_authenticate)
+
+from api.views import RecipeViewSet
+from recipe.models import Favorite, Recipe, RecipeIngredient, ShoppingCart
+from user.models import User
+from .run_benchmark import git_commit
+from .seed_benchmark import benchmark_users
+
+SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+EXECUTION_TIME = re.compile(r'Execution Time: ([\d.]+) ms')
+# .iterator() читает через серверный курсор, объясняем сам SELECT.
+SERVER_CURSOR = re.compile(r'^DECLARE \S+ .*?CURSOR .*?FOR (?=SELECT )')
+PAGE_SIZE = 6
+FLAG_FILTERS = {
+    'Избранное': ('is_favorited', '1'),
+    'Не в избранном': ('is_favorited', '0'),
+    'В корзине': ('is_in_shopping_cart', '1'),
+    'Не в корзине': ('is_in_shopping_cart', '0'),
+}
+FLAG_RELATIONS = {
+    'is_favorited': 'favorite',
+    'is_in_shopping_cart': 'shoppingcart',
+}
+# Без кэша ответов и фрагментов каждый запрос доходит до базы.
+NO_CACHE = {
+    'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+}
+
+
+def hot_endpoints(user):
+    recipe = Recipe.objects.exclude(author=user).order_by(
+        '-date_published').first()
+    return {
+        'Лента рецептов': (None, '/api/recipes/'),
+        'Лента рецептов по курсору': (user, '/api/recipes/?cursor='),
+        'Рецепты автора': (user, f'/api/recipes/?author={recipe.author_id}'),
+        **{name: (user, f'/api/recipes/?{flag}={value}')
+           for name, (flag, value) in FLAG_FILTERS.items()},
+        'Рецепт': (user, f'/api/recipes/{recipe.id}/'),
+        'Подписки': (user, '/api/users/subscriptions/?recipes_limit=3'),
+        'Список покупок': (user, '/api/recipes/download_shopping_cart/'),
+    }
+
+
+def endpoint_queries(user, path):
+    client = APIClient(SERVER_NAME='localhost')
+    client.force_authenticate(user)
+    with CaptureQueriesContext(connection) as context:
+        response = client.get(path)
+        if response.streaming:
+            b''.join(response.streaming_content)
+    if response.status_code != 200:
+        raise CommandError(f'{path}: ответ {response.status_code}')
+    queries = [SERVER_CURSOR.sub('', query['sql'])
+               for query in context.captured_queries]
+    return [sql for sql in queries if sql.startswith('SELECT')]
+
+
+def feed_queryset(user, flag, value):
+    request = APIRequestFactory().get('/api/recipes/', {flag: value})
+    force_authenticate(request, user)
+    view = RecipeViewSet(action_map={'get': 'list'}, args=(), kwargs={},
+                         format_kwarg=None)
+    view.request = view.initialize_request(request)
+    return view.get_page_queryset()
+
+
+def legacy_feed_queryset(user, flag, value):
+    # Так фильтры работали до перехода на Exists: JOIN и DISTINCT.
+    lookup = {f'{FLAG_RELATIONS[flag]}__user': user}
+    queryset = Recipe.objects.order_by('-date_published')
+    if value == '1':
+        return queryset.filter(**lookup).distinct()
+    return queryset.exclude(**lookup).distinct()
+
+
+def page_queries(queryset):
+    with CaptureQueriesContext(connection) as context:
+        queryset.count()
+        list(queryset[:PAGE_SIZE])
+    return [query['sql'] for query in context.captured_queries]
+
+
+def explain(sql, analyze=False):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {"(ANALYZE) " if analyze else ""}{sql}')
+        return '\n'.join(row[0] for row in cursor.fetchall())
+
+
+def analyze_queries(queries):
+    plans = [explain(sql, analyze=True) for sql in queries]
+    return {
+        'time_ms': round(sum(
+            float(EXECUTION_TIME.search(plan).group(1)) for plan in plans
+        ), 3),
+        'plans': [{'sql': sql, 'plan': plan}
+                  for sql, plan in zip(queries, plans)],
+    }
+
+
+class Command(BaseCommand):
+    help = ('Выполняет EXPLAIN для SQL-запросов, которые представления '
+            'API делают на основных эндпоинтах, и завершается с ошибкой, '
+            'если какой-то из них читает таблицу целиком. '
+            'Последовательное сканирование отключается, поэтому '
+            'оставшийся Seq Scan означает отсутствие подходящего индекса. '
+            'С флагом --analyze вместо проверки выполняет EXPLAIN ANALYZE '
+            'с обычными настройками планировщика и выводит в JSON планы '
+            'и время запросов, а для фильтров избранного и корзины — '
+            'сравнение с прежними JOIN и DISTINCT. Требует данных '
+            'seed_benchmark.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Записать планы и время выполнения вместо проверки')
+        parser.add_argument('--output', help='Записать отчёт в файл')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Команда работает только с PostgreSQL')
+        user = benchmark_users().order_by('id').first()
+        if user is None:
+            raise CommandError('Сначала выполните seed_benchmark')
+        if options['analyze']:
+            return self.analyze(user, options)
+
+        failed = []
+        with override_settings(CACHES=NO_CACHE), transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, (client_user, path) in hot_endpoints(user).items():
+                tables = set()
+                for sql in endpoint_queries(client_user, path):
+                    plan = explain(sql)
+                    tables.update(SEQ_SCAN.findall(plan))
+                    if options['verbosity'] > 1:
+                        self.stdout.write(f'{name}:\n{sql}\n{plan}\n')
+                if tables:
+                    failed.append(name)
+                    self.stdout.write(self.style.ERROR(
+                        f'{name}: Seq Scan по {", ".join(sorted(tables))}'))
+                else:
+                    self.stdout.write(f'{name}: ok')
+            transaction.set_rollback(True)
+        if failed:
+            raise CommandError(
+                f'Запросов без подходящего индекса: {", ".join(failed)}')
+        self.stdout.write(self.style.SUCCESS('Все запросы используют индексы'))
+
+    def analyze(self, user, options):
+        with override_settings(CACHES=NO_CACHE), transaction.atomic():
+            endpoints = {
+                name: {'path': path, **analyze_queries(
+                    endpoint_queries(client_user, path))}
+                for name, (client_user, path) in hot_endpoints(user).items()
+            }
+            filters = {
+                name: {
+                    'before': analyze_queries(page_queries(
+                        legacy_feed_queryset(user, flag, value))),
+                    'after': analyze_queries(page_queries(
+                        feed_queryset(user, flag, value))),
+                }
+                for name, (flag, value) in FLAG_FILTERS.items()
+            }
+            transaction.set_rollback(True)
+
+        for name, result in filters.items():
+            self.stderr.write(
+                f'{name}: {result["before"]["time_ms"]} мс с JOIN и '
+                f'DISTINCT, {result["after"]["time_ms"]} мс с Exists')
+        report = json.dumps({
+            'commit': git_commit(),
+            'date': now().isoformat(),
+            'rows': {
+                model._meta.label: model.objects.count()
+                for model in (User, Recipe, RecipeIngredient, Favorite,
+                              ShoppingCart)
+            },
+            'endpoints': endpoints,
+            'filters': filters,
+        }, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report)
+        self.stdout.write(report)
@@ -0,0 +1,168 @@
+import csv
+import json
+import time
+from collections import Counter
+from itertools import islice
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipe.cache import RECIPES_GENERATION, bump_generation_on_commit
+from recipe.images import (RECIPE_VARIANTS, recipe_variants_ready,
+                           schedule_variants)
+from recipe.models import Ingredient, Recipe, RecipeIngredient
+from recipe.search import invalidate_catalogue
+from recipe.subfunctions import shift_counter
+from user.models import User
+
+DEFAULT_PATH = settings.BASE_DIR / 'data' / 'ingredients.json'
+BATCH_SIZE = 1000
+
+
+def read_csv(path):
+    with open(path, encoding='utf-8-sig', newline='') as file:
+        for row in csv.reader(file):
+            if len(row) < 2 or row[:2] == ['name', 'measurement_unit']:
+                continue
+            yield row[0], row[1]
+
+
+def read_json(path):
+    with open(path, encoding='utf-8-sig') as file:
+        for item in json.load(file):
+            yield item['name'], item['measurement_unit']
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def batches(rows, size):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV (name,measurement_unit) или JSON '
+            'пакетами, пропуская уже существующие. С флагом --recipes '
+            'дополнительно загружает рецепты из JSON-фикстуры, пропуская '
+            'рецепты, которые у автора уже есть с тем же названием.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths', nargs='*', default=[DEFAULT_PATH],
+            help='Файлы с ингредиентами (.csv или .json)'
+        )
+        parser.add_argument(
+            '--recipes',
+            help='JSON-фикстура с рецептами и их ингредиентами'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=BATCH_SIZE,
+            help='Размер пакета для вставки'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for path in options['paths']:
+            path = Path(path)
+            reader = READERS.get(path.suffix.lower())
+            if reader is None:
+                raise CommandError(f'Неизвестный формат файла: {path}')
+            if not path.exists():
+                raise CommandError(f'Файл не найден: {path}')
+            self.report(path.name, *self.import_ingredients(
+                reader(path), batch_size))
+        if options['recipes']:
+            self.report('рецепты', *self.import_recipes(
+                Path(options['recipes']), batch_size))
+        invalidate_catalogue()
+
+    def report(self, label, rows, added, started):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: обработано {rows}, добавлено {added}, '
+            f'{rows / elapsed:.0f} строк/с'))
+
+    @transaction.atomic
+    def import_ingredients(self, rows, batch_size):
+        started = time.monotonic()
+        before = Ingredient.objects.count()
+        total = 0
+        for batch in batches(rows, batch_size):
+            total += len(batch)
+            unique = dict.fromkeys(
+                (name.strip(), unit.strip()) for name, unit in batch)
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=unit)
+                 for name, unit in unique if name and unit),
+                ignore_conflicts=True
+            )
+        return total, Ingredient.objects.count() - before, started
+
+    @transaction.atomic
+    def import_recipes(self, path, batch_size):
+        started = time.monotonic()
+        if not path.exists():
+            raise CommandError(f'Файл не найден: {path}')
+        with open(path, encoding='utf-8-sig') as file:
+            fixtures = json.load(file)
+
+        self.import_ingredients(
+            ((item['name'], item['measurement_unit'])
+             for fixture in fixtures for item in fixture['ingredients']),
+            batch_size)
+        ingredient_ids = {
+            (name, unit): pk for pk, name, unit
+            in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit').iterator()
+        }
+        authors = User.objects.in_bulk(
+            {fixture['author'] for fixture in fixtures},
+            field_name='username')
+        missing = {fixture['author'] for fixture in fixtures} - set(authors)
+        if missing:
+            raise CommandError(
+                f'Авторы не найдены: {", ".join(sorted(missing))}')
+
+        seen = set(Recipe.objects.filter(
+            author__in=authors.values()).values_list('author_id', 'name'))
+        new_fixtures = []
+        for fixture in fixtures:
+            key = (authors[fixture['author']].id, fixture['name'])
+            if key not in seen:
+                seen.add(key)
+                new_fixtures.append(fixture)
+
+        recipes = Recipe.objects.bulk_create(
+            (Recipe(author=authors[fixture['author']],
+                    name=fixture['name'],
+                    text=fixture['text'],
+                    cooking_time=fixture['cooking_time'],
+                    image=fixture['image'])
+             for fixture in new_fixtures),
+            batch_size=batch_size
+        )
+        RecipeIngredient.objects.bulk_create(
+            (RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_ids[
+                    (item['name'].strip(), item['measurement_unit'].strip())],
+                amount=item['amount'])
+             for recipe, fixture in zip(recipes, new_fixtures)
+             for item in fixture['ingredients']),
+            batch_size=batch_size
+        )
+
+        for author_id, count in Counter(
+                recipe.author_id for recipe in recipes).items():
+            shift_counter(User, author_id, 'recipes_count', count)
+        for image in {recipe.image.name for recipe in recipes}:
+            schedule_variants(image, RECIPE_VARIANTS, recipe_variants_ready)
+        bump_generation_on_commit(RECIPES_GENERATION)
+        return len(fixtures), len(recipes), started
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+from foodgram.metrics import window_quantiles
+from recipe.models import Ingredient, Recipe
+from recipe.shortlinks import encode_short_code
+from .run_benchmark import git_commit
+
+ERRORS = (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError,
+          ValueError, IndexError)
+
+
+class Connection:
+    def __init__(self, host, port, keep_alive):
+        self.host = host
+        self.port = port
+        self.keep_alive = keep_alive
+        self.reader = self.writer = None
+        self.opened = 0
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(
+                self.host, self.port)
+            self.opened += 1
+        self.writer.write(
+            f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+            f'Connection: {"keep-alive" if self.keep_alive else "close"}'
+            f'\r\n\r\n'.encode())
+        await self.writer.drain()
+        version, status = (await self.reader.readline()).split()[:2]
+        headers = {}
+        while (line := await self.reader.readline()) not in (b'\r\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip().lower()
+        if headers.get('transfer-encoding') == 'chunked':
+            while size := int(
+                    (await self.reader.readline()).split(b';')[0], 16):
+                await self.reader.readexactly(size + 2)
+            await self.reader.readline()
+        else:
+            await self.reader.readexactly(
+                int(headers.get('content-length', 0)))
+        if (not self.keep_alive or headers.get('connection') == 'close'
+                or version == b'HTTP/1.0'
+                and headers.get('connection') != 'keep-alive'):
+            self.close()
+        return int(status)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class Command(BaseCommand):
+    help = ('Нагружает запущенный сервер параллельными клиентами и выводит '
+            'в JSON пропускную способность, задержки p50/p95/p99, коды '
+            'ответов, ошибки и число открытых соединений. Используется для '
+            'сравнения WSGI и ASGI и переиспользования соединений. По '
+            'умолчанию обращается к горячим эндпоинтам на данных '
+            'seed_benchmark.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://localhost:8000',
+                            help='Адрес сервера')
+        parser.add_argument('--concurrency', type=int, default=1000,
+                            help='Число одновременных клиентов')
+        parser.add_argument('--requests', type=int, default=20000,
+                            help='Всего запросов')
+        parser.add_argument('--timeout', type=float, default=30,
+                            help='Таймаут одного запроса в секундах')
+        parser.add_argument(
+            '--no-keep-alive', action='store_false', dest='keep_alive',
+            help='Открывать новое соединение на каждый запрос')
+        parser.add_argument('--path', action='append', dest='paths',
+                            help='Путь для нагрузки, можно указать '
+                                 'несколько раз')
+        parser.add_argument('--label',
+                            help='Метка прогона, например wsgi или asgi')
+        parser.add_argument('--output', help='Записать отчёт в файл')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http' or not url.hostname:
+            raise CommandError('Поддерживаются только адреса http://хост')
+        paths = options['paths'] or self.default_paths()
+        durations, statuses, errors, opened, elapsed = asyncio.run(
+            self.load(url.hostname, url.port or 80, paths, options))
+        if not durations:
+            raise CommandError(f'Ни один запрос не выполнен, ошибок: '
+                               f'{sum(errors.values())}')
+
+        report = json.dumps({
+            'commit': git_commit(),
+            'date': now().isoformat(),
+            'label': options['label'],
+            'url': options['url'],
+            'paths': paths,
+            'concurrency': options['concurrency'],
+            'keep_alive': options['keep_alive'],
+            'requests': options['requests'],
+            'throughput': round(len(durations) / elapsed, 1),
+            'latency_ms': {
+                f'p{round(quantile * 100)}': round(value * 1000, 2)
+                for quantile, value in window_quantiles(durations).items()
+            },
+            'statuses': {str(code): count
+                         for code, count in sorted(statuses.items())},
+            'errors': dict(errors),
+            'connections': opened,
+        }, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report)
+        self.stdout.write(report)
+
+    def default_paths(self):
+        recipe = Recipe.objects.order_by('-date_published').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if recipe is None or ingredient is None:
+            raise CommandError('Сначала выполните seed_benchmark')
+        return [
+            f'/s/{encode_short_code(recipe.id)}/',
+            f'/api/ingredients/?name={ingredient.name[:3]}',
+            f'/api/recipes/{recipe.id}/',
+            f'/api/recipes/{recipe.id}/get-link/',
+        ]
+
+    async def load(self, host, port, paths, options):
+        durations = []
+        statuses = Counter()
+        errors = Counter()
+        remaining = iter(range(options['requests']))
+        connections = [Connection(host, port, options['keep_alive'])
+                       for _ in range(options['concurrency'])]
+
+        async def client(connection):
+            for index in remaining:
+                started = time.perf_counter()
+                try:
+                    status = await asyncio.wait_for(
+                        connection.get(paths[index % len(paths)]),
+                        options['timeout'])
+                except ERRORS as error:
+                    errors[type(error).__name__] += 1
+                    connection.close()
+                    continue
+                durations.append(time.perf_counter() - started)
+                statuses[status] += 1
+            connection.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*map(client, connections))
+        elapsed = time.perf_counter() - started
+        return (durations, statuses, errors,
+                sum(connection.opened for connection in connections),
+                elapsed)
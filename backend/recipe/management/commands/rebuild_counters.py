@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipe.models import Favorite, Recipe
+from user.models import Subscription, User
+
+COUNTERS = (
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'subscribers_count', Subscription, 'author'),
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+)
+
+
+def actual_count(related_model, related_field):
+    return Coalesce(
+        Subquery(
+            related_model.objects
+            .filter(**{related_field: OuterRef('pk')})
+            .order_by()
+            .values(related_field)
+            .annotate(total=Count('pk'))
+            .values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики рецептов, подписчиков и избранного. '
+            'С флагом --check только проверяет их согласованность.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только найти расхождения, не исправляя их'
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            return self.check_counters()
+
+        with transaction.atomic():
+            for model, field, related_model, related_field in COUNTERS:
+                updated = model.objects.update(
+                    **{field: actual_count(related_model, related_field)})
+                self.stdout.write(
+                    f'{model._meta.label}.{field}: обновлено {updated}')
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
+
+    def check_counters(self):
+        mismatches = 0
+        for model, field, related_model, related_field in COUNTERS:
+            broken = model.objects.annotate(
+                actual=actual_count(related_model, related_field)
+            ).exclude(**{field: F('actual')}).values_list(
+                'pk', field, 'actual')
+            for pk, stored, actual in broken.iterator():
+                mismatches += 1
+                self.stdout.write(
+                    f'{model._meta.label}.{field} [{pk}]: '
+                    f'{stored} вместо {actual}')
+        if mismatches:
+            raise CommandError(
+                f'Найдено расхождений: {mismatches}. '
+                'Запустите rebuild_counters без --check')
+        self.stdout.write(self.style.SUCCESS('Счётчики согласованы'))
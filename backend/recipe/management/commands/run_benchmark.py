@@ -0,0 +1,265 @@
+import base64
+import io
+import json
+import subprocess
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Prefetch
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from foodgram.metrics import window_quantiles
+from foodgram.renderers import FastJSONRenderer
+from recipe.images import RECIPE_VARIANTS, render_variant
+from recipe.models import Favorite, Ingredient, Recipe, RecipeIngredient
+from recipe.representations import recipe_representations
+from recipe.serializers import RecipeSerializer
+from recipe.shortlinks import encode_short_code
+from .seed_benchmark import benchmark_users
+
+
+REPRESENTATION_PAGE_SIZES = (6, 50, 500)
+PHOTO_SIZE = (1600, 1200)
+
+
+def image_data():
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), 'green').save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def photo():
+    # Шум сжимается так же плохо, как фотография с телефона.
+    buffer = io.BytesIO()
+    Image.effect_noise(PHOTO_SIZE, 64).convert('RGB').save(
+        buffer, 'JPEG', quality=90)
+    return buffer.getvalue()
+
+
+def image_bytes(data):
+    return {
+        'original': len(data),
+        **{variant: len(render_variant(io.BytesIO(data), variant))
+           for variant in RECIPE_VARIANTS},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def representation_scenarios(sizes=REPRESENTATION_PAGE_SIZES):
+    request = Request(APIRequestFactory(SERVER_NAME='localhost').get(
+        '/api/recipes/'))
+    recipes = Recipe.objects.select_related('author').prefetch_related(
+        Prefetch('recipe_ingredients',
+                 queryset=RecipeIngredient.objects.select_related(
+                     'ingredient'))
+    ).order_by('-date_published')
+
+    def serializer(size):
+        def scenario():
+            JSONRenderer().render(RecipeSerializer(
+                recipes[:size], many=True,
+                context={'request': request}).data)
+        return scenario
+
+    def fast(size):
+        def scenario():
+            ids = list(recipes[:size].values_list('id', flat=True))
+            representations = recipe_representations(ids, request)
+            FastJSONRenderer().render(
+                [representations[pk] for pk in ids])
+        return scenario
+
+    scenarios = {}
+    for size in sizes:
+        scenarios[f'representation_serializer_{size}'] = serializer(size)
+        scenarios[f'representation_fast_{size}'] = fast(size)
+    return scenarios
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет запросы ко всем эндпоинтам API внутри процесса и '
+            'выводит в JSON пропускную способность, задержки '
+            'p50/p95/p99 и число SQL-запросов. Сценарии representation_* '
+            'сравнивают сериализацию страниц из 6, 50 и 500 рецептов '
+            'через RecipeSerializer и через быстрый путь на словарях. '
+            'Сценарий recipe_photo_create_delete загружает фотографию '
+            '1600x1200, а image_variants_inline показывает, сколько '
+            'загрузка ждала бы, если строить уменьшенные копии в запросе; '
+            'в image_bytes — размер оригинала и копий. Требует данных '
+            'seed_benchmark.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Запросов на каждый эндпоинт')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='Прогревочных запросов без замера')
+        parser.add_argument('--only', nargs='*',
+                            help='Запустить только указанные сценарии')
+        parser.add_argument('--output', help='Записать отчёт в файл')
+
+    def handle(self, *args, **options):
+        user = benchmark_users().order_by('id').first()
+        if user is None:
+            raise CommandError('Сначала выполните seed_benchmark')
+        token, _ = Token.objects.get_or_create(user=user)
+        self.anonymous = Client(SERVER_NAME='localhost')
+        self.client = Client(SERVER_NAME='localhost',
+                             HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.user = user
+        self.photo = photo()
+
+        scenarios = self.scenarios()
+        unknown = set(options['only'] or []) - set(scenarios)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные сценарии: {", ".join(sorted(unknown))}. '
+                f'Доступны: {", ".join(scenarios)}')
+
+        results = {}
+        for name, scenario in scenarios.items():
+            if options['only'] and name not in options['only']:
+                continue
+            for _ in range(options['warmup']):
+                scenario()
+            results[name] = self.measure(scenario, options['requests'])
+            self.stderr.write(
+                f'{name}: {results[name]["throughput"]} запр/с, '
+                f'p95 {results[name]["latency_ms"]["p95"]} мс, '
+                f'{results[name]["queries"]["max"]} SQL')
+
+        report = json.dumps({
+            'commit': git_commit(),
+            'date': now().isoformat(),
+            'database': connection.vendor,
+            'requests': options['requests'],
+            'image_bytes': image_bytes(self.photo),
+            'results': results,
+        }, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(report)
+        self.stdout.write(report)
+
+    def measure(self, scenario, requests):
+        durations = []
+        queries = []
+        statuses = Counter()
+        for _ in range(requests):
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                status = scenario()
+                durations.append(time.perf_counter() - started)
+            queries.append(len(context))
+            if status is not None:
+                statuses[status] += 1
+        latency = window_quantiles(durations)
+        return {
+            'throughput': round(len(durations) / sum(durations), 1),
+            'latency_ms': {
+                f'p{round(quantile * 100)}': round(value * 1000, 2)
+                for quantile, value in latency.items()
+            },
+            'queries': {
+                'min': min(queries),
+                'max': max(queries),
+                'mean': round(sum(queries) / len(queries), 2),
+            },
+            'statuses': dict(statuses),
+        }
+
+    def scenarios(self):
+        anonymous, client, user = self.anonymous, self.client, self.user
+        recipe = Recipe.objects.exclude(author=user).order_by(
+            '-date_published').first()
+        author_id = recipe.author_id
+        ingredient = Ingredient.objects.order_by('id').first()
+        code = encode_short_code(recipe.id)
+        image = image_data()
+        photo = self.photo
+        photo_image = ('data:image/jpeg;base64,'
+                       + base64.b64encode(photo).decode())
+        Favorite.objects.filter(user=user, recipe=recipe).delete()
+
+        def get(client, url):
+            return lambda: client.get(url).status_code
+
+        def create_and_delete(image):
+            def scenario():
+                response = client.post('/api/recipes/', {
+                    'name': 'Рецепт для замера',
+                    'text': 'Описание',
+                    'cooking_time': 10,
+                    'image': image,
+                    'ingredients': [{'id': ingredient.id, 'amount': 100}],
+                }, content_type='application/json')
+                if response.status_code == 201:
+                    client.delete(f'/api/recipes/{response.json()["id"]}/')
+                return response.status_code
+            return scenario
+
+        def variants_inline():
+            for variant in RECIPE_VARIANTS:
+                render_variant(io.BytesIO(photo), variant)
+
+        def favorite_toggle():
+            url = f'/api/recipes/{recipe.id}/favorite/'
+            status = client.post(url).status_code
+            client.delete(url)
+            return status
+
+        def download():
+            response = client.get('/api/recipes/download_shopping_cart/')
+            b''.join(response.streaming_content)
+            return response.status_code
+
+        return {
+            'recipes_list_anonymous': get(anonymous, '/api/recipes/'),
+            'recipes_list': get(client, '/api/recipes/'),
+            'recipes_list_cursor': get(client, '/api/recipes/?cursor='),
+            'recipes_filter_author': get(
+                client, f'/api/recipes/?author={author_id}'),
+            'recipes_filter_favorited': get(
+                client, '/api/recipes/?is_favorited=1'),
+            'recipes_filter_cart': get(
+                client, '/api/recipes/?is_in_shopping_cart=1'),
+            'recipe_detail_anonymous': get(
+                anonymous, f'/api/recipes/{recipe.id}/'),
+            'recipe_detail': get(client, f'/api/recipes/{recipe.id}/'),
+            'recipe_create_delete': create_and_delete(image),
+            'recipe_photo_create_delete': create_and_delete(photo_image),
+            'image_variants_inline': variants_inline,
+            'recipe_favorite_toggle': favorite_toggle,
+            'recipe_get_link': get(
+                anonymous, f'/api/recipes/{recipe.id}/get-link/'),
+            'short_link': get(anonymous, f'/s/{code}/'),
+            'ingredients_search': get(
+                anonymous, f'/api/ingredients/?name={ingredient.name[:3]}'),
+            'ingredient_detail': get(
+                anonymous, f'/api/ingredients/{ingredient.id}/'),
+            'users_list': get(anonymous, '/api/users/'),
+            'users_me': get(client, '/api/users/me/'),
+            'user_detail': get(client, f'/api/users/{author_id}/'),
+            'subscriptions': get(
+                client, '/api/users/subscriptions/?recipes_limit=3'),
+            'shopping_cart_download': download,
+            **representation_scenarios(),
+        }
@@ -0,0 +1,188 @@
+import io
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from PIL import Image
+
+from recipe.cache import RECIPES_GENERATION, bump_generation
+from recipe.images import RECIPE_VARIANTS, make_variant
+from recipe.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                           ShoppingCart, ShoppingListItem)
+from recipe.search import invalidate_catalogue
+from user.models import Subscription, User
+
+USERNAME_PREFIX = 'bench_user_'
+INGREDIENT_PREFIX = 'бенчмарк ингредиент '
+PASSWORD = 'bench_password'
+IMAGE_NAME = 'recipes/benchmark.png'
+BATCH_SIZE = 1000
+
+
+def benchmark_users():
+    return User.objects.filter(username__startswith=USERNAME_PREFIX)
+
+
+def raw_delete(queryset):
+    # Без сигналов: счётчики и списки покупок всё равно пересобираются
+    # после заполнения, а построчная обработка сотен тысяч строк долгая.
+    return queryset._raw_delete(queryset.db)
+
+
+def benchmark_image():
+    if not default_storage.exists(IMAGE_NAME):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), 'orange').save(buffer, 'PNG')
+        default_storage.save(IMAGE_NAME, ContentFile(buffer.getvalue()))
+    for variant in RECIPE_VARIANTS:
+        make_variant(IMAGE_NAME, variant)
+    return IMAGE_NAME
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу тестовыми пользователями, рецептами, '
+            'ингредиентами, избранным, корзинами и подписками для '
+            'нагрузочных тестов. Данные прошлого запуска удаляются, поэтому '
+            'повторный запуск с тем же --seed воссоздаёт тот же набор '
+            '(с новыми id).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--recipes', type=int, default=1000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=6)
+        parser.add_argument('--favorites-per-user', type=int, default=20)
+        parser.add_argument('--cart-per-user', type=int, default=5)
+        parser.add_argument('--subscriptions-per-user', type=int, default=10)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            self.clear()
+            users = self.create_users(options['users'])
+            ingredient_ids = self.create_ingredients(options['ingredients'])
+            recipe_ids = self.create_recipes(
+                rng, users, ingredient_ids, options['recipes'],
+                options['ingredients_per_recipe'])
+            self.create_relations(
+                rng, Favorite, users, recipe_ids,
+                options['favorites_per_user'])
+            self.create_relations(
+                rng, ShoppingCart, users, recipe_ids,
+                options['cart_per_user'])
+            self.create_subscriptions(
+                rng, users, options['subscriptions_per_user'])
+        call_command('rebuild_counters')
+        call_command('check_shopping_lists', rebuild=True)
+        invalidate_catalogue()
+        bump_generation(RECIPES_GENERATION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Тестовые данные созданы за '
+            f'{time.monotonic() - started:.1f} с. Пароль пользователей: '
+            f'{PASSWORD}'))
+
+    def clear(self):
+        users = benchmark_users()
+        recipes = Recipe.objects.filter(author__in=users)
+        deleted = sum([
+            raw_delete(ShoppingListItem.objects.filter(user__in=users)),
+            raw_delete(ShoppingCart.objects.filter(
+                Q(user__in=users) | Q(recipe__in=recipes))),
+            raw_delete(Favorite.objects.filter(
+                Q(user__in=users) | Q(recipe__in=recipes))),
+            raw_delete(Subscription.objects.filter(
+                Q(user__in=users) | Q(author__in=users))),
+            raw_delete(RecipeIngredient.objects.filter(recipe__in=recipes)),
+            raw_delete(recipes),
+        ])
+        deleted += users.delete()[0]
+        if deleted:
+            self.stdout.write(f'Удалено данных прошлого запуска: {deleted}')
+
+    def create_users(self, count):
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            (User(username=f'{USERNAME_PREFIX}{index}',
+                  email=f'{USERNAME_PREFIX}{index}@example.com',
+                  first_name='Тест', last_name=str(index),
+                  password=password)
+             for index in range(count)),
+            batch_size=BATCH_SIZE, ignore_conflicts=True
+        )
+        users = list(benchmark_users().order_by('id').values_list(
+            'id', flat=True))
+        self.stdout.write(f'Пользователей: {len(users)}')
+        return users
+
+    def create_ingredients(self, count):
+        Ingredient.objects.bulk_create(
+            (Ingredient(name=f'{INGREDIENT_PREFIX}{index}',
+                        measurement_unit='г')
+             for index in range(count)),
+            batch_size=BATCH_SIZE, ignore_conflicts=True
+        )
+        ingredient_ids = list(Ingredient.objects.filter(
+            name__startswith=INGREDIENT_PREFIX).values_list('id', flat=True))
+        self.stdout.write(f'Ингредиентов: {len(ingredient_ids)}')
+        return ingredient_ids
+
+    def create_recipes(self, rng, users, ingredient_ids, count,
+                       per_recipe):
+        image = benchmark_image()
+        published = now()
+        recipes = Recipe.objects.bulk_create(
+            (Recipe(author_id=rng.choice(users),
+                    name=f'Рецепт {index}',
+                    text='Описание рецепта для нагрузочного теста',
+                    cooking_time=rng.randint(1, 180),
+                    image=image,
+                    image_variants=True,
+                    date_published=published - timedelta(minutes=index))
+             for index in range(count)),
+            batch_size=BATCH_SIZE
+        )
+        per_recipe = min(per_recipe, len(ingredient_ids))
+        RecipeIngredient.objects.bulk_create(
+            (RecipeIngredient(recipe_id=recipe.id, ingredient_id=ingredient,
+                              amount=rng.randint(1, 500))
+             for recipe in recipes
+             for ingredient in rng.sample(ingredient_ids, per_recipe)),
+            batch_size=BATCH_SIZE
+        )
+        self.stdout.write(f'Рецептов: {len(recipes)}')
+        return [recipe.id for recipe in recipes]
+
+    def create_relations(self, rng, model, users, recipe_ids, per_user):
+        per_user = min(per_user, len(recipe_ids))
+        model.objects.bulk_create(
+            (model(user_id=user, recipe_id=recipe)
+             for user in users
+             for recipe in rng.sample(recipe_ids, per_user)),
+            batch_size=BATCH_SIZE, ignore_conflicts=True
+        )
+        count = model.objects.filter(user__in=benchmark_users()).count()
+        self.stdout.write(f'{model._meta.verbose_name_plural}: {count}')
+
+    def create_subscriptions(self, rng, users, per_user):
+        per_user = max(min(per_user, len(users) - 1), 0)
+        Subscription.objects.bulk_create(
+            (Subscription(user_id=user, author_id=author)
+             for user in users
+             for author in [
+                 other for other in rng.sample(users, per_user + 1)
+                 if other != user][:per_user]),
+            batch_size=BATCH_SIZE, ignore_conflicts=True
+        )
+        count = Subscription.objects.filter(
+            user__in=benchmark_users()).count()
+        self.stdout.write(f'Подписок: {count}')
@@ -0,0 +1,78 @@
+# Generated by Django 5.2 on 2026-10-18 18:52
+
+import django.core.validators
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Favorite',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Избранное',
+                'verbose_name_plural': 'Избранное',
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='Ingredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, verbose_name='Название')),
+                ('measurement_unit', models.CharField(max_length=30, verbose_name='Ед. измерения')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент',
+                'verbose_name_plural': 'Ингредиенты',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Recipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=128, verbose_name='Название')),
+                ('image', models.ImageField(upload_to='', verbose_name='Изображение')),
+                ('text', models.TextField(verbose_name='Описание')),
+                ('cooking_time', models.PositiveIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Время приготовления (мин)')),
+                ('date_published', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Дата публикации')),
+            ],
+            options={
+                'verbose_name': 'Рецепт',
+                'verbose_name_plural': 'Рецепты',
+                'ordering': ['-date_published'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecipeIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.IntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='Количество')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент рецепта',
+                'verbose_name_plural': 'Ингредиенты рецепта',
+            },
+        ),
+        migrations.CreateModel(
+            name='ShoppingCart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+            ],
+            options={
+                'verbose_name': 'Корзина покупок',
+                'verbose_name_plural': 'Корзины покупок',
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2 on 2026-10-18 19:10
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    (settings.AUTH_USER_MODEL, 'recipes_count', 'recipe.Recipe', 'author'),
+    (settings.AUTH_USER_MODEL, 'subscribers_count', 'user.Subscription',
+     'author'),
+    ('recipe.Recipe', 'favorites_count', 'recipe.Favorite', 'recipe'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for label, field, related_label, related_field in COUNTERS:
+        related_model = apps.get_model(related_label)
+        apps.get_model(label).objects.update(**{field: Coalesce(
+            Subquery(
+                related_model.objects
+                .filter(**{related_field: OuterRef('pk')})
+                .order_by()
+                .values(related_field)
+                .annotate(total=Count('pk'))
+                .values('total'),
+                output_field=IntegerField()
+            ),
+            0
+        )})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0003_recipe_published_id_idx'),
+        ('user', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 5.2 on 2026-10-18 19:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Sum
+
+BATCH_SIZE = 1000
+
+
+def fill_shopping_lists(apps, schema_editor):
+    ShoppingCart = apps.get_model('recipe', 'ShoppingCart')
+    ShoppingListItem = apps.get_model('recipe', 'ShoppingListItem')
+    totals = (
+        ShoppingCart.objects
+        .values('user_id', 'recipe__recipe_ingredients__ingredient_id')
+        .annotate(total=Sum('recipe__recipe_ingredients__amount'))
+        .filter(total__gt=0)
+        .order_by()
+    )
+    ShoppingListItem.objects.bulk_create(
+        [ShoppingListItem(
+            user_id=row['user_id'],
+            ingredient_id=row['recipe__recipe_ingredients__ingredient_id'],
+            total_amount=row['total'])
+         for row in totals.iterator()],
+        batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0004_recipe_favorites_count'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.PositiveIntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipe.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Списки покупок',
+                'constraints': [models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_user_ingredient')],
+            },
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-18 19:20
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    Ingredient = apps.get_model('recipe', 'Ingredient')
+    RecipeIngredient = apps.get_model('recipe', 'RecipeIngredient')
+    ShoppingListItem = apps.get_model('recipe', 'ShoppingListItem')
+    duplicates = (
+        Ingredient.objects
+        .values('name', 'measurement_unit')
+        .annotate(kept=Min('pk'), total=Count('pk'))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    for row in duplicates:
+        extra = list(Ingredient.objects.filter(
+            name=row['name'], measurement_unit=row['measurement_unit']
+        ).exclude(pk=row['kept']).values_list('pk', flat=True))
+        RecipeIngredient.objects.filter(ingredient_id__in=extra).update(
+            ingredient_id=row['kept'])
+        for item in ShoppingListItem.objects.filter(ingredient_id__in=extra):
+            if ShoppingListItem.objects.filter(
+                    user_id=item.user_id, ingredient_id=row['kept']
+            ).update(total_amount=F('total_amount') + item.total_amount):
+                item.delete()
+            else:
+                item.ingredient_id = row['kept']
+                item.save(update_fields=['ingredient'])
+        Ingredient.objects.filter(pk__in=extra).delete()
+
+
+class Migration(migrations.Migration):
+
+    # Изменение данных и ALTER TABLE в одной транзакции PostgreSQL
+    # запрещает из-за отложенных проверок внешних ключей.
+    atomic = False
+
+    dependencies = [
+        ('recipe', '0005_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients,
+                             migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('name', 'measurement_unit'), name='unique_ingredient_name_unit'),
+        ),
+    ]
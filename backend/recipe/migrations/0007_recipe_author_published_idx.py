@@ -0,0 +1,20 @@
+# Generated by Django 5.2 on 2026-10-18 19:25
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('recipe', '0006_unique_ingredient_name_unit'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-date_published', '-id'], name='recipe_author_published_idx'),
+        ),
+    ]
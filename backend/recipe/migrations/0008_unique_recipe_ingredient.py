@@ -0,0 +1,42 @@
+# Generated by Django 5.2 on 2026-10-18 19:25
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_recipe_ingredients(apps, schema_editor):
+    RecipeIngredient = apps.get_model('recipe', 'RecipeIngredient')
+    duplicates = (
+        RecipeIngredient.objects
+        .values('recipe_id', 'ingredient_id')
+        .annotate(kept=Min('pk'), amount=Sum('amount'), total=Count('pk'))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    # Количества складываются, поэтому списки покупок не меняются.
+    for row in duplicates:
+        RecipeIngredient.objects.filter(pk=row['kept']).update(
+            amount=row['amount'])
+        RecipeIngredient.objects.filter(
+            recipe_id=row['recipe_id'], ingredient_id=row['ingredient_id']
+        ).exclude(pk=row['kept']).delete()
+
+
+class Migration(migrations.Migration):
+
+    # Изменение данных и ALTER TABLE в одной транзакции PostgreSQL
+    # запрещает из-за отложенных проверок внешних ключей.
+    atomic = False
+
+    dependencies = [
+        ('recipe', '0007_recipe_author_published_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_recipe_ingredients,
+                             migrations.RunPython.noop, atomic=True),
+        migrations.AddConstraint(
+            model_name='recipeingredient',
+            constraint=models.UniqueConstraint(fields=('recipe', 'ingredient'), name='unique_recipe_ingredient'),
+        ),
+    ]
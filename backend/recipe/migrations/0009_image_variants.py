@@ -0,0 +1,52 @@
+# Generated by Django 5.2 on 2026-10-18 19:16
+
+import posixpath
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+# Уменьшенные копии, созданные до появления флагов, уже лежат в
+# хранилище рядом с оригиналами.
+IMAGE_FIELDS = (
+    ('recipe.Recipe', 'image', ('card', 'thumbnail')),
+    (settings.AUTH_USER_MODEL, 'avatar', ('avatar',)),
+)
+BATCH_SIZE = 1000
+
+
+def variants_exist(name, variants):
+    return all(
+        default_storage.exists(
+            f'{posixpath.splitext(name)[0]}.{variant}.webp')
+        for variant in variants)
+
+
+def fill_variants(apps, schema_editor):
+    for label, field, variants in IMAGE_FIELDS:
+        model = apps.get_model(label)
+        names = (model.objects.exclude(**{field: ''})
+                 .exclude(**{f'{field}__isnull': True})
+                 .order_by().values_list(field, flat=True).distinct())
+        ready = [name for name in names if variants_exist(name, variants)]
+        for start in range(0, len(ready), BATCH_SIZE):
+            model.objects.filter(
+                **{f'{field}__in': ready[start:start + BATCH_SIZE]}
+            ).update(**{f'{field}_variants': True})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe', '0008_unique_recipe_ingredient'),
+        ('user', '0003_avatar_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Уменьшенные копии готовы'),
+        ),
+        migrations.RunPython(fill_variants, migrations.RunPython.noop),
+    ]
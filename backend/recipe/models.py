@@ -18,11 +18,27 @@ class Recipe(models.Model):
         default=now,
         verbose_name='Дата публикации'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    image_variants = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Уменьшенные копии готовы'
+    )
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ['-date_published']
+        indexes = [
+            models.Index(fields=['-date_published', '-id'],
+                         name='recipe_published_id_idx'),
+            models.Index(fields=['author', '-date_published', '-id'],
+                         name='recipe_author_published_idx'),
+        ]
 
     def get_absolute_url(self):
         return f'/recipes/{self.pk}'
@@ -41,6 +57,12 @@ class Ingredient(models.Model):
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
         ordering = ['name']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name', 'measurement_unit'],
+                name='unique_ingredient_name_unit'
+            )
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -56,6 +78,12 @@ class RecipeIngredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент рецепта'
         verbose_name_plural = 'Ингредиенты рецепта'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_recipe_ingredient'
+            )
+        ]
 
     def __str__(self):
         return f'{self.amount} {self.ingredient} в {self.recipe.name}'
@@ -96,3 +124,32 @@ class ShoppingCart(BaseUserRecipeRelation):
     class Meta(BaseUserRecipeRelation.Meta):
         verbose_name = 'Корзина покупок'
         verbose_name_plural = 'Корзины покупок'
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Списки покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_user_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user}: {self.total_amount} {self.ingredient}'
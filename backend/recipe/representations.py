@@ -0,0 +1,73 @@
+from collections import defaultdict
+
+from .images import image_url
+from .models import Recipe, RecipeIngredient
+from user.models import User
+
+USER_FIELDS = ('id', 'email', 'username', 'first_name', 'last_name',
+               'avatar', 'avatar_variants')
+RECIPE_FIELDS = ('id', 'author_id', 'name', 'image', 'image_variants',
+                 'text', 'cooking_time')
+RECIPE_INGREDIENT_FIELDS = ('recipe_id', 'ingredient_id', 'ingredient__name',
+                            'ingredient__measurement_unit', 'amount')
+
+
+def user_representation(row, request, is_subscribed=False, in_list=True):
+    return {
+        'email': row['email'],
+        'id': row['id'],
+        'username': row['username'],
+        'first_name': row['first_name'],
+        'last_name': row['last_name'],
+        'is_subscribed': is_subscribed,
+        'avatar': image_url(
+            row['avatar'], request,
+            'avatar' if in_list and row['avatar_variants'] else None),
+    }
+
+
+def recipe_short_representation(recipe, request):
+    return {
+        'id': recipe.id,
+        'name': recipe.name,
+        'image': image_url(recipe.image.name, request,
+                           'thumbnail' if recipe.image_variants else None),
+        'cooking_time': recipe.cooking_time,
+    }
+
+
+def recipe_representations(recipe_ids, request, in_list=True):
+    recipes = list(Recipe.objects.filter(pk__in=recipe_ids).order_by()
+                   .values(*RECIPE_FIELDS))
+    authors = {
+        row['id']: user_representation(row, request, in_list=in_list)
+        for row in User.objects.filter(
+            pk__in={recipe['author_id'] for recipe in recipes}
+        ).order_by().values(*USER_FIELDS)
+    }
+    ingredients = defaultdict(list)
+    for row in RecipeIngredient.objects.filter(
+            recipe_id__in=recipe_ids).order_by('pk').values(
+            *RECIPE_INGREDIENT_FIELDS):
+        ingredients[row['recipe_id']].append({
+            'id': row['ingredient_id'],
+            'name': row['ingredient__name'],
+            'measurement_unit': row['ingredient__measurement_unit'],
+            'amount': row['amount'],
+        })
+    return {
+        recipe['id']: {
+            'id': recipe['id'],
+            'author': authors[recipe['author_id']],
+            'ingredients': ingredients[recipe['id']],
+            'is_favorited': False,
+            'is_in_shopping_cart': False,
+            'name': recipe['name'],
+            'image': image_url(
+                recipe['image'], request,
+                'card' if in_list and recipe['image_variants'] else None),
+            'text': recipe['text'],
+            'cooking_time': recipe['cooking_time'],
+        }
+        for recipe in recipes
+    }
@@ -0,0 +1,69 @@
+import hashlib
+import time
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+
+from .cache import INGREDIENTS_GENERATION, bump_generation, get_generation
+from .models import Ingredient
+
+INGREDIENT_SEARCH_LIMIT = 50
+INGREDIENT_FIELDS = ('id', 'name', 'measurement_unit')
+
+
+class IngredientCatalogue:
+    def __init__(self, version, rows):
+        self.version = version
+        self.rows = tuple(sorted(rows, key=lambda row: row['name'].upper()))
+        self.keys = tuple(row['name'].upper() for row in self.rows)
+        self.by_id = {row['id']: row for row in self.rows}
+        self.built = time.monotonic()
+        # ETag зависит только от содержимого, поэтому совпадает у всех
+        # процессов с одинаковым справочником.
+        self.etag = hashlib.sha1(repr([
+            (row['id'], row['name'], row['measurement_unit'])
+            for row in self.rows
+        ]).encode()).hexdigest()[:16]
+
+    def is_fresh(self, version):
+        return (self.version == version and time.monotonic() - self.built
+                < settings.INGREDIENT_CATALOGUE_TTL)
+
+    def search(self, name, limit=INGREDIENT_SEARCH_LIMIT):
+        key = name.upper()
+        hits = []
+        index = bisect_left(self.keys, key)
+        while (index < len(self.keys) and len(hits) < limit
+               and self.keys[index].startswith(key)):
+            hits.append(self.rows[index])
+            index += 1
+        if len(hits) < limit:
+            hits.extend(
+                row for row_key, row in zip(self.keys, self.rows)
+                if key in row_key and not row_key.startswith(key)
+            )
+        return hits[:limit]
+
+
+_catalogue = None
+_catalogue_lock = Lock()
+
+
+def get_catalogue():
+    global _catalogue
+    version = get_generation(INGREDIENTS_GENERATION)
+    catalogue = _catalogue
+    if catalogue is None or not catalogue.is_fresh(version):
+        with _catalogue_lock:
+            if _catalogue is None or not _catalogue.is_fresh(version):
+                _catalogue = IngredientCatalogue(
+                    version,
+                    Ingredient.objects.values(*INGREDIENT_FIELDS)
+                )
+            catalogue = _catalogue
+    return catalogue
+
+
+def invalidate_catalogue(**kwargs):
+    bump_generation(INGREDIENTS_GENERATION)
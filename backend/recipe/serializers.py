@@ -1,14 +1,20 @@
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import Prefetch, prefetch_related_objects
 from rest_framework import serializers
-from drf_extra_fields.fields import Base64ImageField
 from djoser.serializers import UserSerializer as DjoserUserSerializer
 
+from .images import ImageField
 from .models import (Ingredient, Recipe, Favorite, ShoppingCart,
                      RecipeIngredient)
+from .representations import recipe_short_representation
+from .subfunctions import lock_recipes, update_cart_shopping_lists
 from user.models import (User, Subscription)
 
 
 class AvatarSerializer(serializers.ModelSerializer):
-    avatar = Base64ImageField()
+    avatar = ImageField(upload_to='avatars/')
 
     class Meta:
         model = User
@@ -17,7 +23,7 @@ class AvatarSerializer(serializers.ModelSerializer):
 
 class UserSerializer(DjoserUserSerializer):
     is_subscribed = serializers.SerializerMethodField()
-    avatar = Base64ImageField()
+    avatar = ImageField(upload_to='avatars/', variant='avatar')
 
     class Meta:
         model = User
@@ -27,6 +33,9 @@ class UserSerializer(DjoserUserSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        subscribed_ids = self.context.get('subscribed_author_ids')
+        if subscribed_ids is not None:
+            return obj.id in subscribed_ids
         request = self.context.get('request')
         return (
             request
@@ -37,8 +46,7 @@ class UserSerializer(DjoserUserSerializer):
 
 
 class UserSubscriptionSerializer(UserSerializer):
-    recipes_count = serializers.IntegerField(source='recipes.count',
-                                             read_only=True)
+    recipes_count = serializers.IntegerField(read_only=True)
     recipes = serializers.SerializerMethodField()
 
     class Meta:
@@ -50,18 +58,20 @@ class UserSubscriptionSerializer(UserSerializer):
 
     def get_recipes(self, author):
         request = self.context.get('request')
-        limit = request.query_params.get('recipes_limit')
+        if hasattr(author, 'limited_recipes'):
+            recipes = author.limited_recipes
+        else:
+            limit = request.query_params.get('recipes_limit')
 
-        recipes = author.recipes.all()
-        if limit is not None:
-            try:
-                recipes = recipes[:int(limit)]
-            except (ValueError, TypeError):
-                pass
+            recipes = author.recipes.all()
+            if limit is not None:
+                try:
+                    recipes = recipes[:int(limit)]
+                except (ValueError, TypeError):
+                    pass
 
-        return RecipeShortSerializer(
-            recipes, many=True, context=self.context
-        ).data
+        return [recipe_short_representation(recipe, request)
+                for recipe in recipes]
 
 
 
@@ -73,9 +83,7 @@ class IngredientSerializer(serializers.ModelSerializer):
 
 
 class IngredientInRecipeSerializer(serializers.ModelSerializer):
-    id = serializers.PrimaryKeyRelatedField(
-        queryset=Ingredient.objects.all(), source='ingredient'
-    )
+    id = serializers.IntegerField(source='ingredient_id')
     name = serializers.CharField(source='ingredient.name', read_only=True)
     measurement_unit = serializers.CharField(
         source='ingredient.measurement_unit', read_only=True
@@ -95,7 +103,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     cooking_time = serializers.IntegerField(min_value=1, required=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField(required=True, allow_null=False)
+    image = ImageField(variant='card', required=True, allow_null=False)
 
     class Meta:
         model = Recipe
@@ -103,6 +111,13 @@ class RecipeSerializer(serializers.ModelSerializer):
                   'is_in_shopping_cart', 'name', 'image', 'text',
                   'cooking_time')
 
+    def to_representation(self, instance):
+        prefetch_related_objects([instance], Prefetch(
+            'recipe_ingredients',
+            queryset=RecipeIngredient.objects.select_related('ingredient')
+        ))
+        return super().to_representation(instance)
+
     def validate(self, attrs):
         ingredients = attrs.get('recipe_ingredients', [])
         image = attrs.get('image')
@@ -117,7 +132,7 @@ class RecipeSerializer(serializers.ModelSerializer):
                 "Должен быть указан хотя бы один ингредиент"
             )
 
-        ingredient_ids = [ingredient['ingredient'].id for ingredient
+        ingredient_ids = [ingredient['ingredient_id'] for ingredient
                           in ingredients]
 
         if len(set(ingredient_ids)) != len(ingredient_ids):
@@ -125,9 +140,18 @@ class RecipeSerializer(serializers.ModelSerializer):
                 "Ингредиенты не должны повторяться"
             )
 
+        found = Ingredient.objects.in_bulk(ingredient_ids)
+        missing = [pk for pk in ingredient_ids if pk not in found]
+        if missing:
+            raise serializers.ValidationError(
+                {"ingredients": f"Ингредиенты не найдены: {missing}"}
+            )
+
         return attrs
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         return (
             request
@@ -138,6 +162,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         return (
             request
@@ -147,31 +173,79 @@ class RecipeSerializer(serializers.ModelSerializer):
             ).exists()
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('recipe_ingredients', [])
         recipe = super().create(validated_data)
         self.create_recipe_ingredient(recipe, ingredients_data)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients_data = validated_data.pop('recipe_ingredients', [])
-        instance.recipe_ingredients.all().delete()
-        self.create_recipe_ingredient(instance, ingredients_data)
+        ingredients_data = validated_data.pop('recipe_ingredients', None)
+        if ingredients_data is not None:
+            self.update_recipe_ingredients(instance, ingredients_data)
         return super().update(instance, validated_data)
 
+    def update_recipe_ingredients(self, recipe, ingredients_data):
+        new_amounts = {
+            ingredient['ingredient_id']: ingredient['amount']
+            for ingredient in ingredients_data
+        }
+        old_amounts = Counter()
+        existing = {}
+        to_delete = []
+        lock_recipes([recipe.id])
+        for item in RecipeIngredient.objects.filter(recipe=recipe):
+            old_amounts[item.ingredient_id] += item.amount
+            if (item.ingredient_id in new_amounts
+                    and item.ingredient_id not in existing):
+                existing[item.ingredient_id] = item
+            else:
+                to_delete.append(item.pk)
+
+        to_update = []
+        for ingredient_id, item in existing.items():
+            if item.amount != new_amounts[ingredient_id]:
+                item.amount = new_amounts[ingredient_id]
+                to_update.append(item)
+
+        # Массовое удаление не вычитается сигналом: списки покупок
+        # пересчитываются ниже одной разницей old_amounts и new_amounts.
+        if to_delete:
+            RecipeIngredient.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+        self.create_recipe_ingredient(recipe, [
+            ingredient for ingredient in ingredients_data
+            if ingredient['ingredient_id'] not in existing
+        ])
+        update_cart_shopping_lists(recipe.id, old_amounts,
+                                   new_amounts)
+
     def create_recipe_ingredient(self, recipe, ingredients_data):
+        if not ingredients_data:
+            return
         RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=recipe,
-                ingredient=ingredient['ingredient'],
+                ingredient_id=ingredient['ingredient_id'],
                 amount=ingredient['amount']
             )
             for ingredient in ingredients_data
         )
 
 
+class RecipeImageSerializer(serializers.ModelSerializer):
+    image = ImageField(required=True, allow_null=False)
+
+    class Meta:
+        model = Recipe
+        fields = ('image',)
+
+
 class RecipeShortSerializer(serializers.ModelSerializer):
-    image = Base64ImageField()
+    image = ImageField(variant='thumbnail')
 
     class Meta:
         model = Recipe
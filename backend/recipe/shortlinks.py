@@ -0,0 +1,48 @@
+import string
+
+from django.conf import settings
+
+from foodgram.lru import LRUCache
+from .models import Recipe
+
+ALPHABET = string.ascii_letters + string.digits
+BASE = len(ALPHABET)
+INDEX = {char: index for index, char in enumerate(ALPHABET)}
+
+recipe_exists_cache = LRUCache(settings.SHORT_LINK_CACHE_SIZE,
+                               settings.SHORT_LINK_CACHE_TTL)
+
+
+def encode_short_code(pk):
+    code = ''
+    while True:
+        pk, remainder = divmod(pk, BASE)
+        code = ALPHABET[remainder] + code
+        if not pk:
+            break
+    # Код только из цифр перехватил бы старый маршрут s/<int:pk>/,
+    # ведущий ноль алфавита значения не меняет.
+    if code.isdigit():
+        code = ALPHABET[0] + code
+    return code
+
+
+def decode_short_code(code):
+    pk = 0
+    for char in code:
+        if char not in INDEX:
+            return None
+        pk = pk * BASE + INDEX[char]
+    return pk
+
+
+async def arecipe_exists(pk):
+    exists = recipe_exists_cache.get(pk)
+    if exists is None:
+        exists = await Recipe.objects.filter(pk=pk).aexists()
+        recipe_exists_cache.set(pk, exists)
+    return exists
+
+
+def forget_recipe(pk):
+    recipe_exists_cache.delete(pk)
@@ -0,0 +1,191 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+from import_export.signals import post_import
+
+from .cache import (RECIPES_GENERATION, author_generation,
+                    bump_generation_on_commit, recipe_generation)
+from .images import (AVATAR_VARIANTS, RECIPE_VARIANTS, avatar_variants_ready,
+                     recipe_variants_ready, schedule_variants,
+                     variants_exist)
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart)
+from .search import invalidate_catalogue
+from .shortlinks import forget_recipe
+from .subfunctions import (change_shopping_list, lock_recipes, recipe_amounts,
+                           shift_counter, update_cart_shopping_lists)
+from user.models import Subscription, User
+
+# Денормализованные счётчики: модель-источник -> (поле со ссылкой,
+# модель со счётчиком, поле счётчика).
+COUNTERS = {
+    Recipe: ('author_id', User, 'recipes_count'),
+    Favorite: ('recipe_id', Recipe, 'favorites_count'),
+    Subscription: ('author_id', User, 'subscribers_count'),
+}
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredient_changed(sender, **kwargs):
+    invalidate_catalogue()
+
+
+@receiver(post_import)
+def ingredients_imported(model, **kwargs):
+    if model is Ingredient:
+        invalidate_catalogue()
+
+
+@receiver(pre_save, sender=Recipe)
+def check_recipe_variants(sender, instance, **kwargs):
+    instance.image_variants = variants_exist(instance.image.name,
+                                             RECIPE_VARIANTS)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_saved(sender, instance, **kwargs):
+    if not instance.image_variants:
+        schedule_variants(instance.image.name, RECIPE_VARIANTS,
+                          recipe_variants_ready)
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    bump_generation_on_commit(RECIPES_GENERATION,
+                              recipe_generation(instance.pk))
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, **kwargs):
+    if created:
+        transaction.on_commit(partial(forget_recipe, instance.pk))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    transaction.on_commit(partial(forget_recipe, instance.pk))
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    bump_generation_on_commit(RECIPES_GENERATION,
+                              recipe_generation(instance.recipe_id))
+
+
+@receiver(pre_save, sender=User)
+def check_avatar_variants(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'avatar' in update_fields:
+        instance.avatar_variants = variants_exist(instance.avatar.name,
+                                                  AVATAR_VARIANTS)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    if instance.avatar and not instance.avatar_variants:
+        schedule_variants(instance.avatar.name, AVATAR_VARIANTS,
+                          avatar_variants_ready)
+    bump_generation_on_commit(author_generation(instance.pk))
+
+
+@receiver(pre_save, sender=Recipe)
+@receiver(pre_save, sender=Favorite)
+@receiver(pre_save, sender=Subscription)
+@receiver(pre_save, sender=ShoppingCart)
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_saved_row(sender, instance, **kwargs):
+    instance._saved_row = None
+    if not instance._state.adding:
+        instance._saved_row = sender.objects.filter(pk=instance.pk).first()
+
+
+# Списки покупок поддерживаются сигналами, чтобы каскадные удаления и
+# админка их не обходили. Удаляемый рецепт вычитается из списков целиком
+# в pre_delete, а его корзины и ингредиенты затем пропускаются.
+def recipe_being_deleted(instance, origin):
+    return instance.recipe_id in getattr(origin, 'deleting_recipes', ())
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, origin=None, **kwargs):
+    lock_recipes([instance.pk])
+    update_cart_shopping_lists(instance.pk, recipe_amounts(instance.pk), {})
+    if origin is not None:
+        if not hasattr(origin, 'deleting_recipes'):
+            origin.deleting_recipes = set()
+        origin.deleting_recipes.add(instance.pk)
+
+
+# Корзина сохраняется в одной транзакции с обработчиком (get_or_create,
+# админка), иначе правка рецепта увидит её раньше, чем сюда дойдёт
+# блокировка рецепта, и учтёт новые количества дважды.
+@receiver(post_save, sender=ShoppingCart)
+def cart_saved(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_saved_row', None)
+    if previous is not None:
+        change_shopping_list(previous.user_id, previous.recipe_id, -1)
+    if created or previous is not None:
+        change_shopping_list(instance.user_id, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def cart_deleted(sender, instance, origin=None, **kwargs):
+    if not recipe_being_deleted(instance, origin):
+        change_shopping_list(instance.user_id, instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    previous = getattr(instance, '_saved_row', None)
+    old_amounts = {}
+    lock_recipes([instance.recipe_id]
+                 + ([previous.recipe_id] if previous is not None else []))
+    if previous is not None:
+        if previous.recipe_id == instance.recipe_id:
+            old_amounts = {previous.ingredient_id: previous.amount}
+        else:
+            update_cart_shopping_lists(
+                previous.recipe_id,
+                {previous.ingredient_id: previous.amount}, {})
+    update_cart_shopping_lists(
+        instance.recipe_id, old_amounts,
+        {instance.ingredient_id: instance.amount})
+
+
+# Массовое удаление строк ингредиентов пересчитывает списки само: через
+# delete_recipe_ingredients или, как при правке рецепта, одной разницей.
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, origin=None, **kwargs):
+    if (isinstance(origin, QuerySet) and origin.model is RecipeIngredient
+            or recipe_being_deleted(instance, origin)):
+        return
+    lock_recipes([instance.recipe_id])
+    update_cart_shopping_lists(
+        instance.recipe_id, {instance.ingredient_id: instance.amount}, {})
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=Subscription)
+def counted_row_saved(sender, instance, created, **kwargs):
+    field, model, counter = COUNTERS[sender]
+    previous = getattr(instance, '_saved_row', None)
+    if previous is not None and getattr(previous, field) != getattr(
+            instance, field):
+        shift_counter(model, getattr(previous, field), counter, -1)
+    elif not created:
+        return
+    shift_counter(model, getattr(instance, field), counter, 1)
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=Subscription)
+def counted_row_deleted(sender, instance, **kwargs):
+    field, model, counter = COUNTERS[sender]
+    shift_counter(model, getattr(instance, field), counter, -1)
@@ -1,32 +1,153 @@
+import csv
+from collections import Counter
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
 from django.utils.timezone import now
-from io import BytesIO
-
-
-def render_shopping_cart(user, ingredients, recipes):
-    shopping_cart_header = (
-        f"Список покупок на"
-        f"{now().strftime('%d-%m-%Y %H:%M:%S')}\n"
-    )
-    ingredient_lines = [
-        f"{idx}. {item['ingredient__name'].capitalize()} "
-        f"({item['ingredient__measurement_unit']}) - {item['total_amount']}"
-        for idx, item in enumerate(ingredients, start=1)
-    ]
-
-    recipe_lines = [
-        f"- {recipe.name} (@{recipe.author.username})"
-        for recipe in recipes
-    ]
-
-    content = '\n'.join([
-        shopping_cart_header,
-        'Продукты:\n',
-        *ingredient_lines,
-        '\nРецепты с этими продуктами:\n',
-        *recipe_lines,
-    ])
-
-    buffer = BytesIO()
-    buffer.write(content.encode('utf-8'))
-    buffer.seek(0)
-    return buffer
+
+from .models import Recipe, RecipeIngredient, ShoppingCart, ShoppingListItem
+from user.models import User
+
+CHUNK_LINES = 200
+
+
+def shift_counter(model, pk, field, delta):
+    model.objects.filter(pk=pk).update(
+        **{field: Greatest(F(field) + delta, 0)})
+
+
+def recipe_amounts(recipe_id):
+    amounts = Counter()
+    for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id=recipe_id).values_list('ingredient_id', 'amount'):
+        amounts[ingredient_id] += amount
+    return amounts
+
+
+# Состав рецепта читается только под блокировкой его строки, иначе
+# параллельная правка ингредиентов разойдётся со списками покупок.
+# FOR NO KEY UPDATE не мешает вставкам строк, ссылающихся на рецепт
+# или пользователя.
+def lock_recipes(recipe_ids):
+    list(Recipe.objects.select_for_update(no_key=True).filter(
+        pk__in=recipe_ids).order_by('pk').values_list('pk'))
+
+
+@transaction.atomic(savepoint=False)
+def apply_shopping_list_delta(user_ids, deltas):
+    deltas = {key: value for key, value in deltas.items() if value}
+    user_ids = list(user_ids)
+    if not user_ids or not deltas:
+        return
+    list(User.objects.select_for_update(no_key=True).filter(
+        pk__in=user_ids).order_by('pk').values_list('pk'))
+
+    items = {
+        (item.user_id, item.ingredient_id): item
+        for item in ShoppingListItem.objects.filter(
+            user_id__in=user_ids, ingredient_id__in=deltas)
+    }
+    to_create, to_update, to_delete = [], [], []
+    for user_id in user_ids:
+        for ingredient_id, delta in deltas.items():
+            item = items.get((user_id, ingredient_id))
+            total = (item.total_amount if item else 0) + delta
+            if item is None:
+                if total > 0:
+                    to_create.append(ShoppingListItem(
+                        user_id=user_id, ingredient_id=ingredient_id,
+                        total_amount=total))
+            elif total > 0:
+                item.total_amount = total
+                to_update.append(item)
+            else:
+                to_delete.append(item.pk)
+
+    ShoppingListItem.objects.bulk_create(to_create)
+    ShoppingListItem.objects.bulk_update(to_update, ['total_amount'])
+    ShoppingListItem.objects.filter(pk__in=to_delete).delete()
+
+
+@transaction.atomic(savepoint=False)
+def change_shopping_list(user_id, recipe_id, sign):
+    lock_recipes([recipe_id])
+    amounts = recipe_amounts(recipe_id)
+    apply_shopping_list_delta(
+        [user_id],
+        {ingredient_id: sign * amount
+         for ingredient_id, amount in amounts.items()})
+
+
+@transaction.atomic(savepoint=False)
+def update_cart_shopping_lists(recipe_id, old_amounts, new_amounts):
+    deltas = Counter(new_amounts)
+    deltas.subtract(old_amounts)
+    apply_shopping_list_delta(
+        ShoppingCart.objects.filter(
+            recipe_id=recipe_id).values_list('user_id', flat=True),
+        deltas)
+
+
+@transaction.atomic(savepoint=False)
+def delete_recipe_ingredients(queryset):
+    lock_recipes(queryset.values('recipe_id'))
+    removed = {}
+    for recipe_id, ingredient_id, amount in queryset.values_list(
+            'recipe_id', 'ingredient_id', 'amount'):
+        removed.setdefault(recipe_id, Counter())[ingredient_id] += amount
+    for recipe_id, amounts in removed.items():
+        update_cart_shopping_lists(recipe_id, amounts, {})
+    return queryset.delete()
+
+
+def chunked(lines, size=CHUNK_LINES):
+    lines = iter(lines)
+    while chunk := ''.join(islice(lines, size)):
+        yield chunk
+
+
+def shopping_cart_txt_lines(ingredients, recipes):
+    yield f"Список покупок на {now().strftime('%d-%m-%Y %H:%M:%S')}\n\n"
+    yield 'Продукты:\n\n'
+    for idx, item in enumerate(ingredients, start=1):
+        yield (
+            f"{idx}. {item['ingredient__name'].capitalize()} "
+            f"({item['ingredient__measurement_unit']}) - "
+            f"{item['total_amount']}\n"
+        )
+    yield '\nРецепты с этими продуктами:\n\n'
+    for name, username in recipes:
+        yield f'- {name} (@{username})\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def shopping_cart_csv_lines(ingredients, recipes):
+    writer = csv.writer(Echo())
+    yield '\ufeff'
+    yield writer.writerow(('Продукт', 'Ед. измерения', 'Количество'))
+    for item in ingredients:
+        yield writer.writerow((
+            item['ingredient__name'].capitalize(),
+            item['ingredient__measurement_unit'],
+            item['total_amount'],
+        ))
+    yield writer.writerow(())
+    yield writer.writerow(('Рецепт', 'Автор'))
+    for name, username in recipes:
+        yield writer.writerow((name, username))
+
+
+SHOPPING_CART_RENDERERS = {
+    'txt': shopping_cart_txt_lines,
+    'csv': shopping_cart_csv_lines,
+}
+
+
+def render_shopping_cart(ingredients, recipes, file_format='txt'):
+    return chunked(SHOPPING_CART_RENDERERS[file_format](ingredients, recipes))
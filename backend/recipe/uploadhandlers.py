@@ -0,0 +1,54 @@
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from rest_framework.exceptions import ValidationError
+
+IMAGE_SIGNATURES = (
+    (0, b'\xff\xd8\xff'),
+    (0, b'\x89PNG\r\n\x1a\n'),
+    (0, b'GIF87a'),
+    (0, b'GIF89a'),
+    (8, b'WEBP'),
+)
+
+
+def looks_like_image(header):
+    return any(header[offset:offset + len(signature)] == signature
+               for offset, signature in IMAGE_SIGNATURES)
+
+
+class ImageUploadHandler(FileUploadHandler):
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.errors = {}
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0 and not looks_like_image(raw_data):
+            self.errors[self.field_name] = 'Файл не является изображением'
+            raise SkipFile
+        self.received += len(raw_data)
+        if self.received > settings.MAX_IMAGE_UPLOAD_SIZE:
+            self.errors[self.field_name] = (
+                'Размер изображения превышает '
+                f'{settings.MAX_IMAGE_UPLOAD_SIZE // 2 ** 20} МБ')
+            raise SkipFile
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+def read_image_upload(request):
+    content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    if (request.content_type.startswith('multipart/')
+            and content_length > settings.MAX_IMAGE_UPLOAD_SIZE * 2):
+        raise ValidationError({'errors': 'Слишком большой запрос'})
+    handler = ImageUploadHandler(request)
+    request.upload_handlers.insert(0, handler)
+    data = request.data
+    if handler.errors:
+        raise ValidationError(handler.errors)
+    return data
@@ -1,8 +1,10 @@
 from django.urls import path
-from .views import short_link
+from .views import legacy_short_link, short_link
 
 
 urlpatterns = [
     path(
-        's/<int:pk>/', short_link, name='short_link'),
-]
\ No newline at end of file
+        's/<int:pk>/', legacy_short_link, name='legacy_short_link'),
+    path(
+        's/<str:code>/', short_link, name='short_link'),
+]
@@ -1,9 +1,27 @@
+from django.http import Http404, JsonResponse
 from django.shortcuts import redirect
+from django.urls import reverse
 from .models import Recipe
-from django.shortcuts import get_object_or_404
+from .shortlinks import arecipe_exists, decode_short_code, encode_short_code
 
 
-def short_link(request, pk):
-    recipe = get_object_or_404(Recipe, pk=pk)
+async def recipe_redirect(pk):
+    if pk is None or not await arecipe_exists(pk):
+        raise Http404
+    return redirect(Recipe(pk=pk).get_absolute_url())
 
-    return redirect(recipe.get_absolute_url())
\ No newline at end of file
+
+async def short_link(request, code):
+    return await recipe_redirect(decode_short_code(code))
+
+
+async def legacy_short_link(request, pk):
+    return await recipe_redirect(pk)
+
+
+async def get_link(request, pk):
+    if not await arecipe_exists(pk):
+        raise Http404
+    short_url = request.build_absolute_uri(
+        reverse('short_link', args=[encode_short_code(pk)]))
+    return JsonResponse({'short-link': short_url})
@@ -0,0 +1,25 @@
+import copy
+
+from django.conf import settings
+from rest_framework.authentication import TokenAuthentication
+
+from foodgram.lru import LRUCache
+from recipe.cache import peek_generation, token_generation
+
+token_cache = LRUCache(settings.AUTH_TOKEN_CACHE_SIZE,
+                       settings.AUTH_TOKEN_CACHE_TTL)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        # Выход, смена пароля и блокировка сбрасывают поколение токена в
+        # общем кэше, поэтому отзыв сразу виден во всех процессах.
+        generation = peek_generation(token_generation(key))
+        cached = token_cache.get(key)
+        if cached is None or cached[2] != generation:
+            cached = (*super().authenticate_credentials(key), generation)
+            token_cache.set(key, cached)
+        user, token, _ = cached
+        # Каждый запрос получает свою копию, чтобы изменения пользователя
+        # в одном запросе не попадали в кэш.
+        return copy.copy(user), token
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 19:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='siteuser',
+            name='avatar_variants',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Уменьшенные копии готовы'),
+        ),
+    ]
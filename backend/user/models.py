@@ -21,6 +21,17 @@ class SiteUser(AbstractUser):
                                   verbose_name='Имя')
     last_name = models.CharField(max_length=150,
                                  verbose_name='Фамилия')
+    recipes_count = models.PositiveIntegerField(default=0,
+                                                editable=False,
+                                                verbose_name='Рецептов')
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков')
+    avatar_variants = models.BooleanField(
+        default=False,
+        editable=False,
+        verbose_name='Уменьшенные копии готовы')
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -0,0 +1,21 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .models import User
+from recipe.cache import bump_generation_on_commit, token_generation
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    bump_generation_on_commit(token_generation(instance.key))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    keys = list(Token.objects.filter(
+        user_id=instance.pk).values_list('key', flat=True))
+    if keys:
+        bump_generation_on_commit(*map(token_generation, keys))